@@ -0,0 +1,50 @@
+import random
+import torch
+from torch.utils.data import Dataset
+
+
+# Augmented training set built on the fly: the original examples followed by
+# round(augment_ratio * len(dataset)) transformed copies of randomly chosen examples (with a ratio above
+# 1, every example is augmented int(augment_ratio) times, plus once more for a random subset).
+# Examples are transformed and tokenized lazily in __getitem__, i.e. in the DataLoader worker
+# processes, so this CPU work overlaps with training instead of running before the first step.
+# set_epoch(epoch) draws a fresh set of examples to augment and fresh perturbations; both are
+# seeded by (seed, epoch, index), so a run is reproducible whatever the number of workers.
+class OnlineAugmentedDataset(Dataset):
+    def __init__(self, dataset, transform, tokenizer, padding="max_length", augment_ratio=0.2, seed=0):
+        self.dataset = dataset.with_format(None)
+        self.transform = transform
+        self.tokenizer = tokenizer
+        self.padding = padding
+        if augment_ratio < 0:
+            raise ValueError(f"augment_ratio must be non-negative, got {augment_ratio}")
+        self.num_augmented = round(augment_ratio * len(dataset))
+        self.seed = seed
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        rng = random.Random(f"{self.seed}:{epoch}")
+        num_copies, remainder = divmod(self.num_augmented, len(self.dataset))
+        # (source example, copy number) of every augmented example
+        self.augmented_indices = [(source, copy) for copy in range(num_copies) for source in range(len(self.dataset))]
+        self.augmented_indices += [(source, num_copies) for source in rng.sample(range(len(self.dataset)), remainder)]
+
+    def __len__(self):
+        return len(self.dataset) + self.num_augmented
+
+    def __getitem__(self, idx):
+        if idx < len(self.dataset):
+            example = self.dataset[idx]
+            text = example["text"]
+        else:
+            source, copy = self.augmented_indices[idx - len(self.dataset)]
+            example = self.dataset[source]
+            # Copies of the same example get different perturbations
+            rng = random.Random(f"{self.seed}:{self.epoch}:{source}" + (f":{copy}" if copy else ""))
+            text = self.transform.transform_text(example["text"], rng)
+
+        encoding = self.tokenizer(text, padding=self.padding, truncation=True)
+        item = {k: torch.tensor(v) for k, v in encoding.items()}
+        item["labels"] = torch.tensor(example["label"])
+        return item
@@ -0,0 +1,203 @@
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+from datasets import Dataset
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import torch
+import main
+from data_cache import DatasetCache
+from utils import CustomTransform
+
+# Vocabulary of the synthetic reviews; also the vocabulary of the offline tokenizer
+WORDS = ("the a an and but movie film plot story actor actress director scene ending music "
+         "good great bad awful boring brilliant funny sad really very quite pretty totally "
+         "i it was is this that not never ever watch watched love hate like new york city "
+         "special effects science fiction dvd time people character characters script").split()
+
+
+def synthetic_reviews(n, seed=0, min_words=20, max_words=300):
+    rng = random.Random(seed)
+    texts, labels = [], []
+    for _ in range(n):
+        sentences = []
+        remaining = rng.randint(min_words, max_words)
+        while remaining > 0:
+            length = min(remaining, rng.randint(5, 20))
+            sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+            sentences.append(sentence.capitalize() + rng.choice([".", "!", "?"]))
+            remaining -= length
+        texts.append(" ".join(sentences))
+        labels.append(rng.randint(0, 1))
+    return Dataset.from_dict({"text": texts, "label": labels})
+
+
+# Word-level BERT tokenizer built from WORDS, so no download is needed
+def offline_tokenizer(work_dir, max_length):
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS + list("abcdefghijklmnopqrstuvwxyz.,!?'")
+    # Token ids are line numbers, so every entry must be unique
+    vocab = list(dict.fromkeys(vocab))
+    vocab_file = os.path.join(work_dir, "vocab.txt")
+    with open(vocab_file, "w") as f:
+        f.write("\n".join(vocab))
+    return BertTokenizerFast(vocab_file, do_lower_case=True, model_max_length=max_length)
+
+
+def tiny_model(tokenizer, max_length):
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=tokenizer.vocab_size, hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128, max_position_embeddings=max_length,
+                        num_labels=2)
+    return BertForSequenceClassification(config)
+
+
+# Run fn repeats times after warmup runs; fn returns the number of items it processed.
+# With setup, every run calls fn(setup()) and only fn is timed (e.g. to build a fresh model).
+def measure(fn, repeats, warmup, setup=None):
+    call = fn if setup is None else (lambda: fn(setup()))
+    for _ in range(warmup):
+        call()
+    times = []
+    items = 0
+    for _ in range(repeats):
+        state = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        items = fn(*state)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "median": median,
+        "variance": statistics.variance(times) if len(times) > 1 else 0.0,
+        "min": min(times),
+        "items": items,
+        "items_per_sec": items / median if median > 0 else 0.0,
+        "times": times,
+    }
+
+
+def run_benchmarks(args):
+    # Tokenizer vocabulary and prediction files, removed at the end
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as work_dir:
+        return _run_benchmarks(args, work_dir)
+
+
+def _run_benchmarks(args, work_dir):
+    torch.set_num_threads(args.threads)
+
+    main.device = torch.device("cpu")
+    main.tokenizer = offline_tokenizer(work_dir, args.max_length)
+    main.padding = False if args.dynamic_padding else "max_length"
+    main.dataset_cache = DatasetCache(None)
+    main.transform = CustomTransform()
+    train_args = argparse.Namespace(learning_rate=5e-5, num_epochs=1, batch_size=args.batch_size,
+                                    grad_accum_steps=1, precision=args.precision,
+                                    dynamic_padding=args.dynamic_padding, num_proc=None, profile_dir=None)
+
+    reviews = synthetic_reviews(args.num_reviews, seed=args.seed)
+    texts = list(reviews["text"])
+    benches = set(args.benches)
+    results = {}
+
+    if "transform" in benches:
+        try:
+            def transform_run():
+                main.transform.batch({"text": list(texts)}, indices=list(range(len(texts))))
+                return len(texts)
+            results["transform"] = measure(transform_run, args.repeats, args.warmup)
+        except LookupError as e:
+            # NLTK data (punkt / wordnet) is not installed
+            print(f"Skipping transform benchmark: {e}")
+
+    if "tokenize" in benches:
+        def tokenize_batched():
+            main.tokenize_function({"text": texts})
+            return len(texts)
+
+        def tokenize_unbatched():
+            for text in texts:
+                main.tokenize_function({"text": text})
+            return len(texts)
+        results["tokenize_batched"] = measure(tokenize_batched, args.repeats, args.warmup)
+        results["tokenize_unbatched"] = measure(tokenize_unbatched, args.repeats, args.warmup)
+
+    num_examples = args.steps * args.batch_size
+    tokenized = main.prepare_split(train_args, reviews.select(range(min(num_examples, len(reviews)))))
+
+    # Only the training / evaluation loops are timed: models and dataloaders are built beforehand,
+    # and the trained model is not saved
+    if "train" in benches:
+        def train_setup():
+            return (tiny_model(main.tokenizer, args.max_length),
+                    main.create_dataloader(train_args, tokenized, shuffle=True))
+
+        def train_run(state):
+            model, dataloader = state
+            main.do_train(train_args, model, dataloader, save_dir=None)
+            return len(tokenized)
+        results["train_steps"] = measure(train_run, args.repeats, args.warmup, setup=train_setup)
+
+    if "eval" in benches:
+        eval_model = tiny_model(main.tokenizer, args.max_length)
+        eval_dataloader = main.create_dataloader(train_args, tokenized)
+
+        def eval_run():
+            main.do_eval(eval_dataloader, None, os.path.join(work_dir, "predictions.txt"), model=eval_model)
+            return len(tokenized)
+        results["eval_batches"] = measure(eval_run, args.repeats, args.warmup)
+
+    return results
+
+
+# Compare medians with a stored baseline; returns the names of benchmarks that got slower than tolerance
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{name:20s} {baseline[name]['median']:.4f}s -> {result['median']:.4f}s ({ratio:.2f}x) {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benches", nargs="+", default=["transform", "tokenize", "train", "eval"],
+                        choices=["transform", "tokenize", "train", "eval"])
+    parser.add_argument("--num_reviews", type=int, default=500, help="number of synthetic reviews")
+    parser.add_argument("--steps", type=int, default=20, help="number of train steps / eval batches")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "bf16"])
+    parser.add_argument("--dynamic_padding", action="store_true")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="benchmark_results.json")
+    parser.add_argument("--baseline", type=str, default=None, help="results file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    # Read the baseline first, it may be the file that is about to be overwritten
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = run_benchmarks(args)
+    for name, result in results.items():
+        print(f"{name:20s} median {result['median']:.4f}s  variance {result['variance']:.2e}  "
+              f"{result['items_per_sec']:.1f} items/sec")
+
+    with open(args.out, "w") as f:
+        json.dump({"config": vars(args), "torch": torch.__version__, "results": results}, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        exit(1)
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+import argparse
+import sys
+import time
+
+# Subcommands and what they do; each one imports only the modules it needs, when it runs
+COMMANDS = {
+    "train": "train a model (main.py options; --train unless --train_augmented or --distill is given)",
+    "eval": "evaluate a model (main.py options; --eval unless --eval_transformed or --sweep is given)",
+    "transform-preview": "print reviews before and after the custom transformation",
+    "inspect": "print examples of an IMDB split",
+    "score": "score a corpus with a fine-tuned model (score.py options)",
+}
+
+
+# Training and evaluation steps of main.py; cli.py train / eval add --train / --eval only when none
+# of the steps of the command is given
+TRAIN_STEPS = ("--train", "--train_augmented", "--distill")
+EVAL_STEPS = ("--eval", "--eval_transformed", "--sweep")
+
+
+# Wall time of the import / load / run sections of a command, reported with --timings.
+# Sections can be nested (main.run times its tokenizer, dataset and model loading inside "run"):
+# the time of a section excludes the sections nested in it.
+class Timings:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.sections = []
+        self._nested = []
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.sections.append((name, elapsed - nested))
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = sum(elapsed for _, elapsed in self.sections)
+        for name, elapsed in self.sections:
+            print(f"[timings] {name:30s} {elapsed:8.3f}s", file=sys.stderr)
+        print(f"[timings] {'total':30s} {total:8.3f}s", file=sys.stderr)
+
+
+# Run main.py with argv, adding default_step unless argv already chooses one of steps
+def run_pipeline(default_step, steps, argv, timings):
+    with timings.section("import main"):
+        import main
+    given = any(option.split("=")[0] in steps for option in argv)
+    args = main.build_parser().parse_args(argv if given else [default_step, *argv])
+    with timings.section("run"):
+        main.run(args, timings=timings)
+
+
+def run_transform_preview(argv, timings):
+    parser = argparse.ArgumentParser(prog="cli.py transform-preview")
+    parser.add_argument("--text", type=str, action="append", default=None,
+                        help="review to transform (repeatable); default: random reviews of the IMDB test split")
+    parser.add_argument("--num_examples", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the transformation")
+    parser.add_argument("--fused_transform", action="store_true")
+    parser.add_argument("--synonym_index", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    with timings.section("import utils (nltk)"):
+        from utils import CustomTransform
+        from synonym_index import SynonymIndex
+    with timings.section("load transformation"):
+        transform = CustomTransform(fused=args.fused_transform, synonym_index=SynonymIndex(args.synonym_index),
+                                    seed=args.seed)
+    if args.text:
+        texts = args.text
+        source_indices = range(len(texts))
+    else:
+        with timings.section("import datasets"):
+            from datasets import load_dataset
+            import numpy as np
+        with timings.section("load dataset"):
+            test = load_dataset("imdb", split="test", ignore_verifications=True)
+            # The first examples of shuffle(seed=42); each one is transformed with the perturbations it
+            # gets in main.py --eval_transformed, which are seeded by its index in the test split
+            source_indices = np.random.default_rng(42).permutation(len(test))[:args.num_examples].tolist()
+            texts = test.select(source_indices)["text"]
+
+    with timings.section("run"):
+        for k, (text, idx) in enumerate(zip(texts, source_indices)):
+            print("Original Example ", str(k))
+            print(text)
+            print("\n")
+            print("Transformed Example ", str(k))
+            print(transform.transform_text(text, transform.example_rng(idx)))
+            print('=' * 30)
+
+
+def run_inspect(argv, timings):
+    parser = argparse.ArgumentParser(prog="cli.py inspect")
+    parser.add_argument("--split", type=str, default="train")
+    parser.add_argument("--num_examples", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with timings.section("import datasets"):
+        from datasets import load_dataset
+    with timings.section("load dataset"):
+        # Ignore verification to skip the unsupervised split check
+        data = load_dataset("imdb", split=args.split, ignore_verifications=True)
+
+    with timings.section("run"):
+        print(f"{args.split} size: {len(data)}")
+        for i in range(min(args.num_examples, len(data))):
+            print(f"\n{i}th example:")
+            print(data[i])
+
+
+def run_score(argv, timings):
+    with timings.section("import score (torch, transformers)"):
+        import score as scoring
+    args = scoring.parse_args(argv)
+    with timings.section("run"):
+        scoring.main(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Entry point of the pipeline; every command imports only what it needs.",
+        epilog="\n".join(f"  {name:18s} {help}" for name, help in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--timings", action="store_true", help="report import, load and run times on stderr")
+    parser.add_argument("command", choices=list(COMMANDS))
+    parser.add_argument("options", nargs=argparse.REMAINDER, help="options of the command (see <command> --help)")
+    args = parser.parse_args()
+
+    timings = Timings(args.timings)
+    try:
+        if args.command == "train":
+            run_pipeline("--train", TRAIN_STEPS, args.options, timings)
+        elif args.command == "eval":
+            run_pipeline("--eval", EVAL_STEPS, args.options, timings)
+        elif args.command == "transform-preview":
+            run_transform_preview(args.options, timings)
+        elif args.command == "inspect":
+            run_inspect(args.options, timings)
+        else:
+            run_score(args.options, timings)
+    finally:
+        timings.report()
@@ -0,0 +1,126 @@
+from datasets import load_from_disk
+import hashlib
+import json
+import os
+import re
+import shutil
+import torch
+
+# Bump when the layout of cached datasets changes
+CACHE_VERSION = 1
+
+
+# Stable short hash of any JSON-serializable description
+def fingerprint(*parts):
+    payload = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# Stable short hash of the weights (state dict) of a torch module
+def module_fingerprint(module):
+    digest = hashlib.sha256(type(module).__name__.encode("utf-8"))
+    for name, tensor in module.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+# Staging directory of an entry being written: <entry>.tmp<pid of the writer>
+STAGING_PATTERN = re.compile(r"\.tmp(\d+)$")
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Remove the staging directories in directory left behind by processes that no longer run
+def remove_stale_staging(directory):
+    for name in os.listdir(directory):
+        match = STAGING_PATTERN.search(name)
+        if match is not None and not _process_alive(int(match.group(1))):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# Store a cache entry (a directory) at path atomically: write(tmp_path) fills a staging directory
+# of this process, which is then renamed to path. When another process (e.g. another --distributed
+# rank) stored the same entry first, its copy is kept. Used by the dataset, feature and token caches.
+def store_entry(path, write):
+    remove_stale_staging(os.path.dirname(path) or ".")
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        write(tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process stored the same entry first
+            if not os.path.isdir(path):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+# On-disk cache of tokenized / transformed Arrow datasets.
+# An entry is keyed by the fingerprint of the input dataset (which covers the split and any
+# shuffle/select subset) together with a description of the processing step (tokenizer name,
+# max length, transform parameters and version, seed, ...), which also becomes the fingerprint of
+# the result. Entries are reloaded memory-mapped, and the least recently used ones are evicted once
+# the cache grows beyond max_size_gb.
+class DatasetCache:
+    def __init__(self, cache_dir, max_size_gb=20.0):
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_gb * 1024 ** 3)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def map(self, dataset, function, key, **map_kwargs):
+        # The result's fingerprint is the entry name, so that it reflects key (datasets does not see the
+        # values of globals such as the padding or window stride) for downstream caches keyed on it
+        entry = fingerprint(dataset._fingerprint, key)
+        map_kwargs["new_fingerprint"] = entry
+        if self.cache_dir is None:
+            return dataset.map(function, **map_kwargs)
+
+        path = os.path.join(self.cache_dir, entry)
+        if os.path.isdir(path):
+            # Mark the entry as recently used
+            os.utime(path)
+            print(f"Loading cached {key.get('stage', 'dataset')} from {path}")
+            return load_from_disk(path)
+
+        result = dataset.map(function, **map_kwargs)
+        store_entry(path, result.save_to_disk)
+        self.evict(keep=path)
+        return load_from_disk(path)
+
+    # Remove least recently used entries until the cache fits in max_size
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and ".tmp" not in name:
+                entries.append((os.path.getmtime(path), _dir_size(path), path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
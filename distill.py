@@ -0,0 +1,63 @@
+from transformers import AutoModelForSequenceClassification
+import copy
+import re
+import torch
+import torch.nn.functional as F
+
+
+# Student classifier with the teacher's architecture and vocabulary but num_layers layers of
+# hidden_size (default: the teacher's; a different size scales the feed-forward size with it, and
+# num_attention_heads then defaults to hidden_size / 64).
+# With the teacher's width, the student starts from the teacher's embeddings, pooler, classifier and
+# evenly spaced layers; otherwise it is randomly initialized.
+def make_student(teacher, num_layers=4, hidden_size=None, num_attention_heads=None):
+    config = copy.deepcopy(teacher.config)
+    hidden_size = hidden_size or config.hidden_size
+    config.num_hidden_layers = num_layers
+    if hidden_size == config.hidden_size:
+        config.num_attention_heads = num_attention_heads or config.num_attention_heads
+    else:
+        config.num_attention_heads = num_attention_heads or max(1, hidden_size // 64)
+        config.intermediate_size = config.intermediate_size * hidden_size // config.hidden_size
+        config.hidden_size = hidden_size
+    student = AutoModelForSequenceClassification.from_config(config)
+
+    if hidden_size == teacher.config.hidden_size and config.num_attention_heads == teacher.config.num_attention_heads:
+        teacher_layers = teacher.config.num_hidden_layers
+        layer_map = {round(i * (teacher_layers - 1) / max(num_layers - 1, 1)): i for i in range(num_layers)}
+        state = {}
+        for name, tensor in teacher.state_dict().items():
+            match = re.search(r"\.layer\.(\d+)\.", name)
+            if match is None:
+                state[name] = tensor
+            elif int(match.group(1)) in layer_map:
+                state[name.replace(match.group(0), f".layer.{layer_map[int(match.group(1))]}.")] = tensor
+        student.load_state_dict(state, strict=False)
+    return student
+
+
+def num_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+# Soft-label distillation loss: KL divergence between the temperature-softened teacher and student
+# distributions (scaled by temperature^2 to keep gradient magnitudes comparable), mixed with the
+# cross-entropy on the true labels; alpha is the weight of the soft-label term
+def distillation_loss(student_logits, teacher_logits, labels, temperature=2.0, alpha=0.5):
+    soft_loss = F.kl_div(F.log_softmax(student_logits.float() / temperature, dim=-1),
+                         F.softmax(teacher_logits.float() / temperature, dim=-1),
+                         reduction="batchmean") * temperature ** 2
+    hard_loss = F.cross_entropy(student_logits.float(), labels)
+    return alpha * soft_loss + (1 - alpha) * hard_loss
+
+
+# compute_loss hook for do_train: runs the (frozen) teacher on the batch and returns the distillation loss
+def make_distillation_loss(teacher, temperature=2.0, alpha=0.5):
+    teacher.eval()
+
+    def compute_loss(batch, outputs):
+        with torch.no_grad():
+            teacher_logits = teacher(**batch).logits
+        return distillation_loss(outputs.logits, teacher_logits, batch["labels"], temperature, alpha)
+
+    return compute_loss
@@ -0,0 +1,55 @@
+import os
+import sys
+import torch
+import torch.distributed as dist
+
+
+# True when this process was started by torchrun (or the built-in launcher)
+def launched_by_torchrun():
+    return "RANK" in os.environ and "WORLD_SIZE" in os.environ
+
+
+# Re-run the current command under torch.distributed.run with nproc_per_node processes on this
+# machine, which then see launched_by_torchrun(); raises if one of them fails
+def launch(nproc_per_node):
+    from torch.distributed.run import main as torchrun
+    torchrun(["--standalone", f"--nproc_per_node={nproc_per_node}", sys.argv[0], *sys.argv[1:]])
+
+
+# Join the gloo process group and pin this process to its share of the CPU cores: the cores
+# available to the job are split into LOCAL_WORLD_SIZE contiguous blocks (one per process on this
+# machine), and intra-op threads are limited to the block. Returns (rank, world_size).
+def init_distributed(backend="gloo"):
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    cores = sorted(os.sched_getaffinity(0))
+    per_process = max(1, len(cores) // local_world_size)
+    own_cores = cores[local_rank * per_process:(local_rank + 1) * per_process] or cores
+    os.sched_setaffinity(0, own_cores)
+    torch.set_num_threads(len(own_cores))
+
+    dist.init_process_group(backend)
+    print(f"Rank {dist.get_rank()}/{dist.get_world_size()} pinned to cores {own_cores[0]}-{own_cores[-1]}")
+    return dist.get_rank(), dist.get_world_size()
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return rank() == 0
+
+
+# Wait for all processes (no-op outside distributed mode)
+def barrier():
+    if is_distributed():
+        dist.barrier()
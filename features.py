@@ -0,0 +1,94 @@
+from data_cache import fingerprint, module_fingerprint, store_entry
+from tqdm.auto import tqdm
+import numpy as np
+import os
+import tempfile
+import torch
+import torch.nn as nn
+
+# Arrays of a feature store entry, all in dataloader order
+FEATURE_ARRAYS = ("features", "labels", "lengths", "review_ids")
+
+
+# The dropout and linear classifier applied to the pooled encoder output (e.g. BertForSequenceClassification)
+def classifier_head(model):
+    classifier = getattr(model, "classifier", None)
+    dropout = getattr(model, "dropout", None)
+    if not isinstance(classifier, nn.Linear) or dropout is None or getattr(model.base_model, "pooler", None) is None:
+        raise ValueError(f"Head-only training needs a model with a pooler and a linear classifier "
+                         f"(e.g. BERT), not {type(model).__name__}")
+    return dropout, classifier
+
+
+# Run the encoder over the dataloader and write the pooled output ([CLS] through the pooler, the
+# input of the classifier), labels, token lengths and (for --long_document windows) review ids of
+# every example to .npy files in path, batch by batch, without holding the features in memory
+def extract_features(model, dataloader, device, path):
+    classifier_head(model)
+    num_examples = len(dataloader.dataset)
+    hidden_size = model.config.hidden_size
+    arrays = {
+        "features": np.lib.format.open_memmap(os.path.join(path, "features.npy"), mode="w+", dtype=np.float32,
+                                              shape=(num_examples, hidden_size)),
+        "labels": np.zeros(num_examples, dtype=np.int64),
+        "lengths": np.zeros(num_examples, dtype=np.int64),
+    }
+
+    model.eval()
+    offset = 0
+    for batch in tqdm(dataloader, desc="Extracting features"):
+        review_ids = batch.pop("review_id", None)
+        labels = batch.pop("labels")
+        batch = {k: v.to(device) for k, v in batch.items()}
+        with torch.no_grad():
+            pooled = model.base_model(**batch).pooler_output
+        end = offset + len(labels)
+        if review_ids is not None:
+            arrays.setdefault("review_ids", np.zeros(num_examples, dtype=np.int64))[offset:end] = review_ids.numpy()
+        arrays["features"][offset:end] = pooled.float().cpu().numpy()
+        arrays["labels"][offset:end] = labels.numpy()
+        arrays["lengths"][offset:end] = batch["attention_mask"].sum(dim=-1).cpu().numpy()
+        offset = end
+
+    arrays["features"].flush()
+    for name, array in arrays.items():
+        if name != "features":
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+
+# On-disk store of pooled encoder features, memory-mapped on load.
+# An entry is keyed by the encoder weights, the fingerprint of the tokenized dataset behind the
+# dataloader, and key (anything else that changes the features or their order, e.g. padding);
+# dataloaders must therefore not shuffle.
+# With store_dir None, features are extracted to a temporary directory on every call, read into
+# memory and the directory is removed.
+class FeatureStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def load(self, model, dataloader, device, key=None):
+        if self.store_dir is None:
+            with tempfile.TemporaryDirectory(prefix="features_") as path:
+                extract_features(model, dataloader, device, path)
+                return {name: np.array(array) for name, array in self._open(path).items()}
+
+        # Only the encoder weights, so that a model whose head was retrained on cached features
+        # still maps to the features it was trained on
+        entry = fingerprint(module_fingerprint(model.base_model), dataloader.dataset._fingerprint, key)
+        path = os.path.join(self.store_dir, entry)
+        if os.path.isdir(path):
+            print(f"Loading cached features from {path}")
+            return self._open(path)
+
+        store_entry(path, lambda tmp_path: extract_features(model, dataloader, device, tmp_path))
+        return self._open(path)
+
+    def _open(self, path):
+        arrays = {}
+        for name in FEATURE_ARRAYS:
+            file = os.path.join(path, f"{name}.npy")
+            if os.path.exists(file):
+                arrays[name] = np.load(file, mmap_mode="r")
+        return arrays
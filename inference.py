@@ -0,0 +1,175 @@
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from types import SimpleNamespace
+import copy
+import torch
+import torch.nn as nn
+
+# IMDB label ids
+LABEL_NAMES = ("negative", "positive")
+
+
+# Takes (input_ids, attention_mask) and returns the logits only; this is the graph that is exported
+class LogitsModule(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+# Makes a logits-only graph usable by do_eval, which calls model(**batch).logits
+class GraphModelAdapter(nn.Module):
+    def __init__(self, graph, num_labels):
+        super().__init__()
+        self.graph = graph
+        self.config = SimpleNamespace(num_labels=num_labels)
+
+    def forward(self, input_ids, attention_mask, **kwargs):
+        return SimpleNamespace(logits=self.graph(input_ids, attention_mask))
+
+
+# Runs an exported ONNX graph with onnxruntime (optional dependency) on CPU
+class OnnxModelAdapter(nn.Module):
+    def __init__(self, path, num_labels):
+        super().__init__()
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("Running ONNX models requires onnxruntime: pip install onnxruntime")
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.config = SimpleNamespace(num_labels=num_labels)
+
+    def forward(self, input_ids, attention_mask, **kwargs):
+        logits = self.session.run(["logits"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+        })[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+# Copy of the model with every nn.Linear replaced by a dynamically quantized int8 Linear (CPU only)
+def quantize_dynamic_int8(model):
+    model = copy.deepcopy(model).cpu().eval()
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def export_torchscript(model, example_batch, path):
+    module = LogitsModule(model).cpu().eval()
+    inputs = (example_batch["input_ids"].cpu(), example_batch["attention_mask"].cpu())
+    with torch.no_grad():
+        traced = torch.jit.trace(module, inputs, strict=False)
+    torch.jit.save(traced, path)
+    return path
+
+
+def load_torchscript(path, num_labels):
+    return GraphModelAdapter(torch.jit.load(path, map_location="cpu"), num_labels).eval()
+
+
+def export_onnx(model, example_batch, path):
+    module = LogitsModule(model).cpu().eval()
+    inputs = (example_batch["input_ids"].cpu(), example_batch["attention_mask"].cpu())
+    with torch.no_grad():
+        torch.onnx.export(
+            module, inputs, path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "logits": {0: "batch"}},
+            opset_version=14,
+        )
+    return path
+
+
+def load_onnx(path, num_labels):
+    return OnnxModelAdapter(path, num_labels)
+
+
+# Fine-tuned model (in eval mode, on device) and its tokenizer, for serving and scoring
+def load_classifier(model_dir, tokenizer_name="bert-base-cased", device=torch.device("cpu"), quantize=False):
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    if quantize:
+        model, device = quantize_dynamic_int8(model), torch.device("cpu")
+    model.to(device)
+    model.eval()
+    return model, tokenizer, device
+
+
+# Logits of a list of raw texts, tokenized together and padded to the longest one
+def predict_logits(model, tokenizer, texts, device, max_length=None):
+    inputs = tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    inputs = {k: v.to(device) for k, v in inputs.items() if k in ("input_ids", "attention_mask")}
+    with torch.no_grad():
+        return model(**inputs).logits.float().cpu()
+
+
+# Label, label name and probabilities of each row of logits
+def format_predictions(logits):
+    probabilities = torch.softmax(logits, dim=-1)
+    confidence, labels = probabilities.max(dim=-1)
+    results = []
+    for label, prob, probs in zip(labels.tolist(), confidence.tolist(), probabilities.tolist()):
+        name = LABEL_NAMES[label] if label < len(LABEL_NAMES) else str(label)
+        results.append({"label": label, "sentiment": name, "probability": prob, "probabilities": probs})
+    return results
+
+
+# Logits of a chunk of raw texts, in the original order. The texts are sorted by token length and
+# cut into batches of batch_size, each padded only to its own longest sequence.
+def predict_logits_sorted(model, tokenizer, texts, device, batch_size=32, max_length=None):
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+    logits = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch = tokenizer.pad({"input_ids": [encodings[i] for i in indices]}, return_tensors="pt")
+        batch = {k: v.to(device) for k, v in batch.items() if k in ("input_ids", "attention_mask")}
+        with torch.no_grad():
+            batch_logits = model(**batch).logits.float().cpu()
+        for i, row in zip(indices, batch_logits):
+            logits[i] = row
+    return torch.stack(logits) if logits else torch.empty(0)
+
+
+# Combine the logits of overlapping windows into one row per review.
+# review_ids: the review (0 .. num_reviews - 1) each window belongs to
+# method: "mean", "max" (per class), or "weighted" (mean weighted by each window's number of
+#         attended tokens, so short tail windows count less)
+def aggregate_window_logits(logits, review_ids, num_reviews, method="mean", weights=None):
+    logits = logits.float()
+    if method == "max":
+        out = torch.full((num_reviews, logits.shape[-1]), float("-inf"), dtype=logits.dtype)
+        index = review_ids.unsqueeze(-1).expand_as(logits)
+        return out.scatter_reduce(0, index, logits, reduce="amax", include_self=True)
+
+    if method == "weighted":
+        weights = weights.float()
+    else:
+        weights = torch.ones(len(logits))
+    totals = torch.zeros(num_reviews).index_add_(0, review_ids, weights)
+    sums = torch.zeros(num_reviews, logits.shape[-1]).index_add_(0, review_ids, logits * weights.unsqueeze(-1))
+    return sums / totals.clamp(min=1e-12).unsqueeze(-1)
+
+
+# Logits of a chunk of raw texts, covering the whole of each text: every text is split into
+# overlapping windows of max_length tokens (stride tokens of overlap), windows of all texts are
+# sorted by length and packed into shared batches, and the window logits are aggregated per text
+def predict_logits_windows(model, tokenizer, texts, device, batch_size=32, max_length=512, stride=128,
+                           method="mean"):
+    encodings = tokenizer(texts, truncation=True, max_length=max_length, stride=stride,
+                          return_overflowing_tokens=True)
+    windows = encodings["input_ids"]
+    review_ids = torch.tensor(encodings["overflow_to_sample_mapping"])
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    window_logits = torch.zeros(len(windows), model.config.num_labels)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch = tokenizer.pad({"input_ids": [windows[i] for i in indices]}, return_tensors="pt")
+        batch = {k: v.to(device) for k, v in batch.items() if k in ("input_ids", "attention_mask")}
+        with torch.no_grad():
+            window_logits[indices] = model(**batch).logits.float().cpu()
+    lengths = torch.tensor([len(window) for window in windows])
+    return aggregate_window_logits(window_logits, review_ids, len(texts), method=method, weights=lengths)
@@ -1,17 +1,37 @@
 import datasets
 from datasets import load_dataset
 from transformers import AutoTokenizer
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, BatchSampler, RandomSampler, SequentialSampler
+from torch.utils.data.distributed import DistributedSampler
+from torch.nn.parallel import DistributedDataParallel
 from transformers import AutoModelForSequenceClassification
 from torch.optim import AdamW
 from transformers import get_scheduler
+from transformers import DataCollatorWithPadding
 import torch
 from tqdm.auto import tqdm
-import evaluate
 import random
 import argparse
 from utils import *
+from data_cache import DatasetCache, module_fingerprint
+from profiling import StageTimer, make_profiler
+from metrics import StreamingMetrics
+from inference import quantize_dynamic_int8, export_torchscript, load_torchscript, export_onnx, load_onnx
+from inference import aggregate_window_logits
+from features import FeatureStore, classifier_head
+from prediction_cache import CachedPredictor, PredictionCache
+from augmentation import OnlineAugmentedDataset
+import distributed
+from token_store import load_token_store
+from distill import make_student, make_distillation_loss, num_parameters
 import os
+import math
+import time
+import json
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # Set seed
 random.seed(0)
@@ -21,17 +41,175 @@ torch.backends.cudnn.deterministic = True
 torch.backends.cudnn.benchmark = False
 
 
-# Tokenize the input
+# Padding strategy used by tokenize_function; set to False by --dynamic_padding so that
+# every batch is padded only to its own longest sequence by the collator
+padding = "max_length"
+
+# Cache of model predictions consulted by do_eval, set by --prediction_cache
+prediction_cache = None
+
+# Number of overlapping tokens between consecutive windows of a review with --long_document
+window_stride = 128
+
+# Timings of cli.py --timings, in which run times the tokenizer, dataset and model loading
+load_timings = None
+
+
+# Context manager timing a section of run when it was started by cli.py --timings
+def timed(name):
+    return load_timings.section(name) if load_timings is not None else contextlib.nullcontext()
+
+
+# Load a pretrained or fine-tuned classifier
+def load_model(name_or_path, **kwargs):
+    with timed("load model"):
+        return AutoModelForSequenceClassification.from_pretrained(name_or_path, **kwargs)
+
+
+# Tokenize the input; the "length" column (number of tokens) is what create_dataloader sorts by with
+# --dynamic_padding, and is not passed to the model (see set_model_format)
 def tokenize_function(examples):
-    return tokenizer(examples["text"], padding="max_length", truncation=True)
+    return tokenizer(examples["text"], padding=padding, truncation=True, return_length=True)
+
+
+# Tokenize the input into overlapping windows covering the whole review (--long_document);
+# every window is a row with the label and the index (review_id) of its review
+def tokenize_windows(examples, indices):
+    windows = tokenizer(examples["text"], padding=padding, truncation=True, stride=window_stride,
+                        return_overflowing_tokens=True, return_length=True)
+    sample_mapping = windows.pop("overflow_to_sample_mapping")
+    windows["review_id"] = [indices[i] for i in sample_mapping]
+    windows["label"] = [examples["label"][i] for i in sample_mapping]
+    return windows
+
+
+# Cache key describing tokenize_function / tokenize_windows
+def tokenize_key(windows=False):
+    return {
+        "stage": "tokenize",
+        "tokenizer": tokenizer.name_or_path,
+        "max_length": tokenizer.model_max_length,
+        "padding": padding,
+        "window_stride": window_stride if windows else None,
+        "return_length": True,
+    }
+
+
+# Return the columns of a tokenized dataset as torch tensors, without the "length" column
+def set_model_format(tokenized):
+    tokenized.set_format("torch", columns=[column for column in tokenized.column_names if column != "length"])
+
+
+# Cache key describing the transformation applied by custom_transform.batch (default: transform)
+def transform_key(custom_transform=None):
+    return {"stage": "transform", **(custom_transform or transform).config()}
+
+
+# Transform split_dataset with custom_transform, cached in cache (a DatasetCache); a module-level
+# function of picklable arguments, so that do_sweep can run it in worker processes
+def transform_dataset(split_dataset, custom_transform, cache, num_proc=None):
+    return cache.map(split_dataset, custom_transform.batch, transform_key(custom_transform), batched=True,
+                     with_indices=True, num_proc=num_proc, load_from_cache_file=False)
+
+
+# IMDB splits, each loaded on first access
+class LazySplits(dict):
+    def __missing__(self, split):
+        with timed(f"load dataset ({split})"):
+            self[split] = load_dataset("imdb", split=split, ignore_verifications=True)
+        return self[split]
+
+
+# Tokenize a split (or a shuffled subset of size examples of it) and prepare it for use by model
+# With windows=True every review becomes one or more overlapping windows (see tokenize_windows)
+def prepare_split(args, split_dataset, size=None, windows=False):
+    if size is not None:
+        split_dataset = split_dataset.shuffle(seed=42).select(range(size))
+    with timed("tokenize dataset"):
+        if windows:
+            tokenized = dataset_cache.map(split_dataset, tokenize_windows, tokenize_key(windows=True), batched=True,
+                                          with_indices=True, remove_columns=split_dataset.column_names,
+                                          num_proc=args.num_proc)
+        else:
+            tokenized = dataset_cache.map(split_dataset, tokenize_function, tokenize_key(), batched=True,
+                                          num_proc=args.num_proc)
+            tokenized = tokenized.remove_columns(["text"])
+    tokenized = tokenized.rename_column("label", "labels")
+    set_model_format(tokenized)
+    return tokenized
+
+
+# Create a dataloader for a tokenized dataset
+# With --dynamic_padding, examples of similar length are grouped into the same batch and
+# each batch is padded to its longest sequence (batches are shuffled between buckets for training)
+# With --distributed, a shuffled (training) dataloader only yields this process's shard of the batches
+def create_dataloader(args, dataset, shuffle=False):
+    shard = shuffle and distributed.is_distributed()
+    if getattr(args, "token_store", None) is not None:
+        return create_token_store_dataloader(args, dataset, shuffle=shuffle, shard=shard)
+    if not args.dynamic_padding:
+        sampler = DistributedSampler(dataset, shuffle=True, seed=0) if shard else None
+        return DataLoader(dataset, shuffle=shuffle and sampler is None, sampler=sampler, batch_size=args.batch_size)
+
+    # Only the length column is read, not the token ids
+    lengths = dataset.with_format(None)["length"]
+    batch_sampler = LengthBucketBatchSampler(lengths, args.batch_size, shuffle=shuffle,
+                                             num_replicas=distributed.world_size() if shard else 1,
+                                             rank=distributed.rank() if shard else 0)
+    collator = DataCollatorWithPadding(tokenizer)
+    return DataLoader(dataset, batch_sampler=batch_sampler, collate_fn=collator)
+
+
+# Create a dataloader reading batches from the memory-mapped token store of a tokenized dataset
+# (--token_store), exported on first use. Batches are always padded to their longest sequence;
+# with --dynamic_padding, examples of similar length are also grouped into the same batch.
+def create_token_store_dataloader(args, dataset, shuffle=False, shard=False):
+    store = load_token_store(args.token_store, dataset, tokenizer.pad_token_id)
+    if args.dynamic_padding:
+        batch_sampler = LengthBucketBatchSampler(store.lengths, args.batch_size, shuffle=shuffle,
+                                                 num_replicas=distributed.world_size() if shard else 1,
+                                                 rank=distributed.rank() if shard else 0)
+    else:
+        if shard:
+            sampler = DistributedSampler(store, shuffle=True, seed=0)
+        else:
+            sampler = RandomSampler(store) if shuffle else SequentialSampler(store)
+        batch_sampler = BatchSampler(sampler, args.batch_size, drop_last=False)
+
+    loader_kwargs = {}
+    if args.num_workers > 0:
+        loader_kwargs["prefetch_factor"] = args.prefetch_factor
+    # batch_size=None: every index the sampler yields is a whole batch of indices, sliced by the store
+    return DataLoader(store, sampler=batch_sampler, batch_size=None, num_workers=args.num_workers,
+                      pin_memory=device.type == "cuda", **loader_kwargs)
+
+
+# Per-stage timer and optional torch.profiler trace of a loop, enabled with --profile_dir
+def make_instrumentation(args, name):
+    profile_dir = getattr(args, "profile_dir", None)
+    timer = StageTimer(name, device, enabled=profile_dir is not None)
+    if profile_dir is not None and args.profile_trace:
+        profiler = make_profiler(os.path.join(profile_dir, f"trace_{name}"), args.trace_start, args.trace_steps)
+    else:
+        profiler = make_profiler(None)
+    return timer, profiler
 
 
 # Core training function
-def do_train(args, model, train_dataloader, save_dir="./out"):
+# With --grad_accum_steps N, gradients of N consecutive batches are accumulated before each optimizer step,
+# and with --precision bf16 the forward pass runs under torch.autocast in bfloat16.
+# With --distributed, every process trains on its shard of the batches, gradients are averaged across
+# processes (once per accumulation group) by DistributedDataParallel, and only rank 0 saves the model.
+# compute_loss(batch, outputs): optional replacement of the model's own loss (e.g. for distillation)
+# save_dir: where the trained model is saved; not saved when None (e.g. benchmarks)
+def do_train(args, model, train_dataloader, save_dir="./out", compute_loss=None):
     optimizer = AdamW(model.parameters(), lr=args.learning_rate)
     num_epochs = args.num_epochs
-    # len(train_dataloader) number of batches per epoch
-    num_training_steps = num_epochs * len(train_dataloader)
+    grad_accum_steps = args.grad_accum_steps
+    # len(train_dataloader) number of batches per epoch, one optimizer step every grad_accum_steps batches
+    num_batches = len(train_dataloader)
+    steps_per_epoch = math.ceil(num_batches / grad_accum_steps)
+    num_training_steps = num_epochs * steps_per_epoch
     lr_scheduler = get_scheduler(
         name="linear",
         optimizer=optimizer, 
@@ -39,7 +217,10 @@ def do_train(args, model, train_dataloader, save_dir="./out"):
         num_training_steps=num_training_steps
     )
     model.train()
-    progress_bar = tqdm(range(num_training_steps))
+    train_model = DistributedDataParallel(model) if distributed.is_distributed() else model
+    progress_bar = tqdm(range(num_training_steps), disable=not distributed.is_main_process())
+    use_bf16 = args.precision == "bf16"
+    timer, profiler = make_instrumentation(args, "train")
 
     ################################
     ##### YOUR CODE BEGINGS HERE ###
@@ -49,73 +230,336 @@ def do_train(args, model, train_dataloader, save_dir="./out"):
     # You can use progress_bar.update(1) to see the progress during training
     # You can refer to the pytorch tutorial covered in class for reference
 
-    for epoch in range(num_epochs):
-        for batch in train_dataloader:
-            # move batch to device
-            # What is the k and v then????
-            batch = {k: v.to(device) for k, v in batch.items()}
-
+    with profiler:
+        for epoch in range(num_epochs):
+            timer.start_epoch()
+            # New order / shards (--distributed) and fresh perturbations (--online_augmentation) every epoch
+            for component in (train_dataloader.dataset, train_dataloader.sampler, train_dataloader.batch_sampler,
+                              getattr(train_dataloader.sampler, "sampler", None)):
+                if hasattr(component, "set_epoch"):
+                    component.set_epoch(epoch)
             # Zero gradients
             optimizer.zero_grad()
-            
-            # Forward pass
-            # model(**batch) is equivalent to model(input_ids=tensor1, attention_mask=tensor2, labels=tensor3)
-            outputs = model(**batch)
 
-            loss = outputs.loss
+            for step, batch in enumerate(timer.iterate(train_dataloader)):
+                # move batch to device
+                with timer.stage("to_device"):
+                    batch = {k: v.to(device) for k, v in batch.items()}
+
+                # Average the loss over the batches of this accumulation group (the last one may be shorter)
+                group_start = step - step % grad_accum_steps
+                group_size = min(grad_accum_steps, num_batches - group_start)
+                # Processes only exchange gradients on the last batch of each accumulation group
+                if train_model is not model and step + 1 != group_start + group_size:
+                    sync_context = train_model.no_sync()
+                else:
+                    sync_context = contextlib.nullcontext()
+
+                with sync_context:
+                    # Forward pass
+                    # model(**batch) is equivalent to model(input_ids=tensor1, attention_mask=tensor2, labels=tensor3)
+                    with timer.stage("forward"):
+                        with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
+                            outputs = train_model(**batch)
+                            loss = outputs.loss if compute_loss is None else compute_loss(batch, outputs)
+                        loss = loss / group_size
+
+                    # Backward pass
+                    with timer.stage("backward"):
+                        loss.backward()
+
+                if step + 1 == group_start + group_size:
+                    # Update optimizer
+                    with timer.stage("optimizer"):
+                        optimizer.step()
+                        # Zero gradients
+                        optimizer.zero_grad()
+
+                    # Update learning rate scheduler
+                    with timer.stage("lr_scheduler"):
+                        lr_scheduler.step()
+
+                    # Update Progress bar
+                    progress_bar.update(1)
+
+                timer.add_batch(batch["labels"].shape[0])
+                profiler.step()
+
+            timer.end_epoch()
 
-            # Backward pass
-            loss.backward()
+    ##### YOUR CODE ENDS HERE ######
 
-            # Update optimizer
-            optimizer.step()
+    print("Training completed...")
+    if distributed.is_main_process():
+        if timer.enabled:
+            name = os.path.basename(os.path.normpath(save_dir)) if save_dir is not None else "model"
+            timer.write(os.path.join(args.profile_dir, f"train_{name}.json"))
+        if save_dir is not None:
+            print("Saving Model....")
+            model.save_pretrained(save_dir)
+    distributed.barrier()
 
-            # Update learning rate scheduler
-            lr_scheduler.step()
+    return
 
-            # Update Progress bar
-            progress_bar.update(1)
 
-    ##### YOUR CODE ENDS HERE ######
+# Train a smaller student model (--distill) on the soft labels of the fine-tuned model in --teacher_dir,
+# with the same training loop, tokenizer and data as do_train; the student is saved to save_dir
+def do_distill(args, train_dataloader, save_dir="./out_student"):
+    teacher = load_model(args.teacher_dir)
+    teacher.to(device)
+    student = make_student(teacher, num_layers=args.student_layers, hidden_size=args.student_hidden_size,
+                           num_attention_heads=args.student_heads)
+    student.to(device)
+    print(f"Distilling {args.teacher_dir} ({num_parameters(teacher) / 1e6:.1f}M parameters) into a student with "
+          f"{args.student_layers} layers of size {student.config.hidden_size} ({num_parameters(student) / 1e6:.1f}M)")
+
+    compute_loss = make_distillation_loss(teacher, temperature=args.distill_temperature, alpha=args.distill_alpha)
+    # The student has its own learning rate and number of epochs
+    student_args = argparse.Namespace(**{**vars(args), "learning_rate": args.distill_learning_rate,
+                                         "num_epochs": args.distill_epochs})
+    do_train(student_args, student, train_dataloader, save_dir=save_dir, compute_loss=compute_loss)
+    return student
+
+
+# Cache key of the pooled features of a tokenized dataset, besides the encoder and dataset fingerprints
+# (the padding changes the batches, and with --dynamic_padding the order of the examples)
+def feature_key():
+    return {"stage": "features", "padding": padding}
+
+
+# Train only the classification head (--head_only) on the pooled encoder features of the examples of
+# train_dataloaders, extracted once and cached in feature_store; the encoder stays frozen.
+# The whole model, with the trained head, is saved to save_dir like do_train does.
+# Only runs on the first process with --distributed (the other ones have nothing to do).
+def do_train_head(args, model, train_dataloaders, save_dir="./out"):
+    dropout, classifier = classifier_head(model)
+    parts = [feature_store.load(model, dataloader, device, feature_key()) for dataloader in train_dataloaders]
+    features = torch.from_numpy(np.concatenate([part["features"] for part in parts])).to(device)
+    labels = torch.from_numpy(np.concatenate([part["labels"] for part in parts])).to(device)
+
+    optimizer = AdamW(classifier.parameters(), lr=args.head_learning_rate)
+    num_batches = math.ceil(len(labels) / args.head_batch_size)
+    num_training_steps = args.head_epochs * num_batches
+    lr_scheduler = get_scheduler(name="linear", optimizer=optimizer, num_warmup_steps=0,
+                                 num_training_steps=num_training_steps)
+    dropout.train()
+    classifier.train()
+    generator = torch.Generator().manual_seed(0)
+    progress_bar = tqdm(range(num_training_steps))
+
+    for epoch in range(args.head_epochs):
+        order = torch.randperm(len(labels), generator=generator).to(device)
+        for start in range(0, len(labels), args.head_batch_size):
+            indices = order[start:start + args.head_batch_size]
+            logits = classifier(dropout(features[indices]))
+            loss = torch.nn.functional.cross_entropy(logits, labels[indices])
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            lr_scheduler.step()
+            progress_bar.update(1)
 
     print("Training completed...")
     print("Saving Model....")
     model.save_pretrained(save_dir)
 
-    return
+
+# Evaluate only the classification head (--head_only) on the cached pooled features of eval_dataloader.
+# Returns the same scores as do_eval, which the full model reproduces up to padding effects.
+def do_eval_head(args, eval_dataloader, out_file, model=None):
+    if model is None:
+        model = load_model(args.model_dir)
+        model.to(device)
+    _, classifier = classifier_head(model)
+    stored = feature_store.load(model, eval_dataloader, device, feature_key())
+
+    classifier.eval()
+    with torch.no_grad():
+        logits = classifier(torch.from_numpy(np.array(stored["features"])).to(device)).float().cpu()
+    labels = torch.from_numpy(np.array(stored["labels"]))
+    lengths = torch.from_numpy(np.array(stored["lengths"]))
+    if "review_ids" in stored:
+        logits, labels, lengths = aggregate_review_windows(logits, labels, lengths,
+                                                           torch.from_numpy(np.array(stored["review_ids"])),
+                                                           method=getattr(args, "window_agg", "mean"))
+
+    metric = StreamingMetrics(num_labels=model.config.num_labels)
+    metric.update(logits, labels, lengths)
+    score = metric.compute()
+    predictions = torch.argmax(logits, dim=-1)
+    write_predictions(out_file, predictions, labels, logits, save_npz=getattr(args, "save_logits", False))
+    return score
+
+
+# Write predictions and labels as alternating lines, and optionally a compact .npz next to it
+def write_predictions(out_file, predictions, labels, logits=None, save_npz=False):
+    lines = torch.stack([predictions, labels], dim=1).reshape(-1).tolist()
+    with open(out_file, "w") as f:
+        f.write("".join(f"{value}\n" for value in lines))
+
+    if save_npz:
+        np.savez(os.path.splitext(out_file)[0] + ".npz", predictions=predictions.numpy(), labels=labels.numpy(),
+                 logits=logits.float().numpy())
+
+
+# Aggregate window rows (--long_document) into one row per review, in review_id order.
+# The review length is the total number of tokens without the overlaps and repeated [CLS]/[SEP].
+def aggregate_review_windows(logits, labels, lengths, review_ids, method="mean"):
+    unique_ids, inverse = torch.unique(review_ids, return_inverse=True)
+    num_reviews = len(unique_ids)
+    review_logits = aggregate_window_logits(logits, inverse, num_reviews, method=method, weights=lengths)
+    review_labels = torch.zeros(num_reviews, dtype=labels.dtype).scatter_(0, inverse, labels)
+    num_windows = torch.bincount(inverse, minlength=num_reviews)
+    review_lengths = torch.zeros(num_reviews, dtype=lengths.dtype).index_add_(0, inverse, lengths)
+    review_lengths -= (num_windows - 1) * (window_stride + 2)
+    return review_logits, review_labels, review_lengths
 
 
 # Core evaluation function
 # output_dir: the file path of your fine-tuned model
 # out_file: the name of your model
-def do_eval(eval_dataloader, output_dir, out_file):
-    model = AutoModelForSequenceClassification.from_pretrained(output_dir)
-    model.to(device)
+# args: optional command line arguments, used for --profile_dir instrumentation and --save_logits
+# model: an already loaded model (e.g. just trained); loaded from output_dir when None
+# eval_device: device to run on instead of the global device (quantized and exported models run on CPU)
+# cache_predictions: look up / store the predictions in prediction_cache (when set), so that only
+#                    examples the model has not seen yet are run through it
+def do_eval(eval_dataloader, output_dir, out_file, args=None, model=None, eval_device=None, cache_predictions=True):
+    eval_device = eval_device or device
+    if model is None:
+        model = load_model(output_dir)
+    model.to(eval_device)
     model.eval()
+    cache = prediction_cache if cache_predictions else None
+    if cache is not None:
+        # Misses are run batch_size at a time across dataloader batches, so the logits of a batch
+        # are only complete (and scored) after predictor.flush()
+        predictor = CachedPredictor(model, cache, module_fingerprint(model), eval_device,
+                                    getattr(args, "batch_size", None) or eval_dataloader.batch_size or 8)
+
+    metric = StreamingMetrics(num_labels=model.config.num_labels)
+    timer, profiler = make_instrumentation(args, "eval")
+    all_logits, all_labels, all_lengths, all_review_ids = [], [], [], []
+
+    with profiler:
+        timer.start_epoch()
+        for batch in tqdm(timer.iterate(eval_dataloader), total=len(eval_dataloader)):
+            # Windows of long reviews (--long_document) carry the id of their review
+            review_ids = batch.pop("review_id", None)
+            if cache is not None:
+                # The batch stays on CPU, only the cache misses are moved to the device
+                with timer.stage("forward"):
+                    logits = predictor.add(batch)
+            else:
+                with timer.stage("to_device"):
+                    batch = {k: v.to(eval_device) for k, v in batch.items()}
+                with timer.stage("forward"):
+                    with torch.no_grad():
+                        logits = model(**batch).logits
+
+            # Update the metrics from the batch tensors, and keep them to write them once at the end
+            # (window rows are only scored once they are aggregated per review, and cached predictions
+            # once the buffered misses are run)
+            with timer.stage("metrics"):
+                lengths = batch["attention_mask"].sum(dim=-1)
+                if review_ids is None and cache is None:
+                    metric.update(logits, batch["labels"], lengths)
+                else:
+                    if review_ids is not None:
+                        all_review_ids.append(review_ids)
+                    all_lengths.append(lengths.cpu())
+                all_logits.append(logits if cache is not None else logits.detach().cpu())
+                all_labels.append(batch["labels"].cpu())
+
+            timer.add_batch(batch["labels"].shape[0])
+            profiler.step()
+        if cache is not None:
+            with timer.stage("forward"):
+                predictor.flush()
+        timer.end_epoch()
+
+    if cache is not None:
+        cache.evict()
+        print(f"Prediction cache: {cache.stats()}")
+
+    logits = torch.cat(all_logits)
+    labels = torch.cat(all_labels)
+    if all_review_ids:
+        logits, labels, lengths = aggregate_review_windows(logits, labels, torch.cat(all_lengths),
+                                                           torch.cat(all_review_ids),
+                                                           method=getattr(args, "window_agg", "mean"))
+        metric.update(logits, labels, lengths)
+    elif cache is not None:
+        metric.update(logits, labels, torch.cat(all_lengths))
+    predictions = torch.argmax(logits, dim=-1)
+    score = metric.compute()
 
-    metric = evaluate.load("accuracy")
-    out_file = open(out_file, "w")
+    write_predictions(out_file, predictions, labels, logits, save_npz=getattr(args, "save_logits", False))
+    if timer.enabled:
+        timer.write(os.path.join(args.profile_dir, f"eval_{os.path.splitext(os.path.basename(out_file))[0]}.json"))
 
-    for batch in tqdm(eval_dataloader):
-        batch = {k: v.to(device) for k, v in batch.items()}
-        with torch.no_grad():
-            outputs = model(**batch)
+    return score
 
-        logits = outputs.logits
-        predictions = torch.argmax(logits, dim=-1)
-        metric.add_batch(predictions=predictions, references=batch["labels"])
 
-        # write to output file
-        # because they were tensors
-        for pred, label in zip(predictions, batch["labels"]):
-                out_file.write(f"{pred.item()}\n")
-                out_file.write(f"{label.item()}\n")
-    out_file.close()
-    score = metric.compute()
+# CPU inference variant of model selected by --quantize / --export, and its name
+def build_inference_model(args, model, eval_dataloader):
+    num_labels = model.config.num_labels
+    if args.quantize:
+        return quantize_dynamic_int8(model), "int8"
+
+    example_batch = next(iter(eval_dataloader))
+    if args.export == "torchscript":
+        path = args.export_path or os.path.join(args.model_dir, "model.torchscript.pt")
+        export_torchscript(model, example_batch, path)
+        print(f"Exported TorchScript graph to {path}")
+        return load_torchscript(path, num_labels), "torchscript"
 
+    path = args.export_path or os.path.join(args.model_dir, "model.onnx")
+    export_onnx(model, example_batch, path)
+    print(f"Exported ONNX graph to {path}")
+    return load_onnx(path, num_labels), "onnx"
+
+
+# Evaluate the model, and with --quantize / --export also its CPU inference variant on the same
+# dataloader, reporting the accuracy difference and the eval time of both
+def run_eval(args, eval_dataloader, out_file, model=None):
+    if getattr(args, "head_only", False):
+        score = do_eval_head(args, eval_dataloader, out_file, model=model)
+        print("Score: ", score)
+        return score
+
+    compare = args.quantize or args.export is not None
+    if compare and model is None:
+        model = load_model(args.model_dir)
+
+    start = time.perf_counter()
+    score = do_eval(eval_dataloader, args.model_dir, out_file, args=args, model=model)
+    print("Score: ", score)
+    if not compare:
+        return score
+
+    elapsed = time.perf_counter() - start
+    variant, name = build_inference_model(args, model, eval_dataloader)
+    variant_file = os.path.splitext(out_file)[0] + f"_{name}.txt"
+    start = time.perf_counter()
+    variant_score = do_eval(eval_dataloader, args.model_dir, variant_file, args=args, model=variant,
+                            eval_device=torch.device("cpu"), cache_predictions=False)
+    variant_elapsed = time.perf_counter() - start
+    print(f"Score ({name}): ", variant_score)
+    print(f"Accuracy difference ({name} - fp32): {variant_score['accuracy'] - score['accuracy']:+.4f}")
+    print(f"Eval time: fp32 {elapsed:.1f}s, {name} {variant_elapsed:.1f}s")
     return score
 
 
+# 5k random examples of the training set, transformed
+def create_augmentation_examples(args, dataset):
+    random_5k = dataset["train"].shuffle(seed=42).select(range(5000))
+    transformed_5k = dataset_cache.map(random_5k, transform.batch, transform_key(), batched=True, with_indices=True,
+                                       num_proc=args.num_proc, load_from_cache_file=False)
+    if args.num_proc is None:
+        print(f"Synonym lookups: {transform.synonym_index.stats()}")
+    return transformed_5k
+
+
 # Created a dataladoer for the augmented training dataset
 def create_augmented_dataloader(args, dataset):
     ################################
@@ -129,35 +573,56 @@ def create_augmented_dataloader(args, dataset):
     original_train = dataset["train"]
     
     # Get 5k random examples from the training set and transform them
-    random_5k = dataset["train"].shuffle(seed=42).select(range(5000))
-    transformed_5k = random_5k.map(custom_transform, load_from_cache_file=False)
+    transformed_5k = create_augmentation_examples(args, dataset)
     
     # Concatenate original training data with transformed 5k examples
     augmented_dataset = datasets.concatenate_datasets([original_train, transformed_5k])
     
     # Tokenize the augmented dataset
-    augmented_tokenized = augmented_dataset.map(tokenize_function, batched=True, load_from_cache_file=False)
+    augmented_tokenized = dataset_cache.map(augmented_dataset, tokenize_function, tokenize_key(), batched=True,
+                                            num_proc=args.num_proc, load_from_cache_file=False)
     
     # Prepare dataset for use by model
     augmented_tokenized = augmented_tokenized.remove_columns(["text"])
     augmented_tokenized = augmented_tokenized.rename_column("label", "labels")
-    augmented_tokenized.set_format("torch")
+    set_model_format(augmented_tokenized)
     
     # Create dataloader
-    train_dataloader = DataLoader(augmented_tokenized, shuffle=True, batch_size=args.batch_size)
+    train_dataloader = create_dataloader(args, augmented_tokenized, shuffle=True)
 
     ##### YOUR CODE ENDS HERE ######
 
     return train_dataloader
 
 
+# Create a dataloader for the training set augmented on the fly (--online_augmentation): every epoch
+# --augment_ratio of the examples are transformed again with new perturbations, and transformation
+# and tokenization run in --num_workers worker processes that prefetch batches during training
+def create_online_augmented_dataloader(args, dataset):
+    augmented_dataset = OnlineAugmentedDataset(dataset["train"], transform, tokenizer, padding=padding,
+                                               augment_ratio=args.augment_ratio, seed=transform.seed)
+    loader_kwargs = {}
+    if args.num_workers > 0:
+        loader_kwargs["prefetch_factor"] = args.prefetch_factor
+    collator = DataCollatorWithPadding(tokenizer) if args.dynamic_padding else None
+    sampler = DistributedSampler(augmented_dataset, shuffle=True, seed=0) if distributed.is_distributed() else None
+    return DataLoader(augmented_dataset, shuffle=sampler is None, sampler=sampler, batch_size=args.batch_size,
+                      collate_fn=collator, num_workers=args.num_workers, pin_memory=device.type == "cuda",
+                      **loader_kwargs)
+
+
 # Create a dataloader for the transformed test set
 # the debug_transformation is for test to see if the custom_transform is working
 def create_transformed_dataloader(args, dataset, debug_transformation):
     # Print 5 random transformed examples
     if debug_transformation:
-        small_dataset = dataset["test"].shuffle(seed=42).select(range(5))
-        small_transformed_dataset = small_dataset.map(custom_transform, load_from_cache_file=False)
+        # The first examples of shuffle(seed=42), each transformed with the perturbations it gets in the
+        # transformed test set, which are seeded by its index in the split
+        source_indices = np.random.default_rng(42).permutation(len(dataset["test"]))[:5].tolist()
+        small_dataset = dataset["test"].select(source_indices)
+        small_transformed_dataset = small_dataset.map(
+            lambda examples, positions: transform.batch(examples, [source_indices[p] for p in positions]),
+            batched=True, with_indices=True, load_from_cache_file=False)
         for k in range(5):
             print("Original Example ", str(k))
             print(small_dataset[k])
@@ -168,20 +633,76 @@ def create_transformed_dataloader(args, dataset, debug_transformation):
 
         exit()
 
-    transformed_dataset = dataset["test"].map(custom_transform, load_from_cache_file=False)
-    transformed_tokenized_dataset = transformed_dataset.map(tokenize_function, batched=True, load_from_cache_file=False)
-    transformed_tokenized_dataset = transformed_tokenized_dataset.remove_columns(["text"])
-    transformed_tokenized_dataset = transformed_tokenized_dataset.rename_column("label", "labels")
-    transformed_tokenized_dataset.set_format("torch")
+    transformed_dataset = transform_dataset(dataset["test"], transform, dataset_cache, num_proc=args.num_proc)
+    if args.num_proc is None:
+        print(f"Synonym lookups: {transform.synonym_index.stats()}")
+    transformed_tokenized_dataset = prepare_split(args, transformed_dataset, windows=args.long_document)
 
     transformed_val_dataset = transformed_tokenized_dataset
-    eval_dataloader = DataLoader(transformed_val_dataset, batch_size=args.batch_size)
+    eval_dataloader = create_dataloader(args, transformed_val_dataset)
 
     return eval_dataloader
 
 
-if __name__ == "__main__":
-
+# Transformation parameters a sweep config may set (keyword arguments of CustomTransform)
+SWEEP_PARAMETERS = ("synonym_probability", "typo_probability", "letter_replace_prob", "filler_probability",
+                    "before_word_prob", "seed")
+
+
+# Sweep grid file: a JSON list of configs, or a dict of parameter -> list of values (every combination)
+def load_sweep_grid(path):
+    with open(path) as f:
+        grid = json.load(f)
+    if isinstance(grid, dict):
+        names = list(grid)
+        values = [grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names]
+        grid = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+    for config in grid:
+        unknown = set(config) - set(SWEEP_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown transformation parameters in {path}: {sorted(unknown)}")
+    return grid
+
+
+# Evaluate one model on the test set transformed with every config of the --sweep grid and write a
+# single accuracy table. The model, tokenizer and dataset are loaded once. The variants are
+# transformed concurrently by --sweep_workers processes (each with --num_proc workers, and cached
+# like --eval_transformed) while the main process tokenizes and evaluates them in grid order.
+def do_sweep(args, dataset, model=None):
+    if model is None:
+        model = load_model(args.model_dir)
+        model.to(device)
+    grid = load_sweep_grid(args.sweep)
+    model_name = os.path.basename(os.path.normpath(args.model_dir))
+    transforms = [CustomTransform(fused=transform.fused, synonym_index=transform.synonym_index,
+                                  **{"seed": transform.seed, **config}) for config in grid]
+    num_workers = args.sweep_workers or min(len(grid), os.cpu_count() or 1)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max(1, num_workers)) as pool:
+        futures = [pool.submit(transform_dataset, dataset["test"], config_transform, dataset_cache, args.num_proc)
+                   for config_transform in transforms]
+        for i, (config, config_transform, future) in enumerate(zip(grid, transforms, futures)):
+            print(f"Sweep config {i + 1}/{len(grid)}: {config}")
+            eval_dataloader = create_dataloader(args, prepare_split(args, future.result(), windows=args.long_document))
+            score = do_eval(eval_dataloader, args.model_dir, f"{model_name}_sweep_{i}.txt", args=args, model=model)
+            parameters = {name: getattr(config_transform, name) for name in SWEEP_PARAMETERS}
+            rows.append({"config": i, **parameters, "accuracy": score["accuracy"], "macro_f1": score["macro_f1"],
+                         "ece": score["ece"]})
+
+    out_file = args.sweep_out or f"{model_name}_sweep.tsv"
+    columns = list(rows[0]) if rows else []
+    lines = ["\t".join(columns)]
+    lines += ["\t".join(f"{row[c]:.4f}" if isinstance(row[c], float) else str(row[c]) for c in columns) for row in rows]
+    with open(out_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    print(f"Sweep results written to {out_file}")
+    return rows
+
+
+# Command line options of the training / evaluation pipeline
+def build_parser():
     parser = argparse.ArgumentParser()
 
     # Arguments
@@ -189,89 +710,266 @@ if __name__ == "__main__":
     parser.add_argument("--train_augmented", action="store_true", help="train a model on the augmented training data")
     parser.add_argument("--eval", action="store_true", help="evaluate model on the test set")
     parser.add_argument("--eval_transformed", action="store_true", help="evaluate model on the transformed test set")
+    parser.add_argument("--sweep", type=str, default=None,
+                        help="JSON grid of transformation configs; evaluate the model on the test set transformed "
+                             "with each of them and write one accuracy table")
+    parser.add_argument("--sweep_out", type=str, default=None,
+                        help="TSV file of the sweep results (default: <model>_sweep.tsv)")
+    parser.add_argument("--sweep_workers", type=int, default=None,
+                        help="number of processes transforming sweep configs concurrently "
+                             "(default: one per config, up to the number of CPUs)")
     parser.add_argument("--model_dir", type=str, default="./out")
     parser.add_argument("--debug_train", action="store_true",
                         help="use a subset for training to debug your training loop")
     parser.add_argument("--debug_transformation", action="store_true",
                         help="print a few transformed examples for debugging")
+    parser.add_argument("--distributed", action="store_true",
+                        help="train with one process per share of the CPU cores (torch.distributed, gloo); "
+                             "without torchrun, starts --nproc_per_node processes itself")
+    parser.add_argument("--nproc_per_node", type=int, default=2,
+                        help="number of training processes started by --distributed outside torchrun")
+    parser.add_argument("--distill", action="store_true",
+                        help="train a smaller student model on the soft labels of the model in --teacher_dir "
+                             "(saved to ./out_student, which the eval steps then evaluate)")
+    parser.add_argument("--distill_data", type=str, default="original", choices=["original", "augmented"],
+                        help="training data of the student")
+    parser.add_argument("--teacher_dir", type=str, default="./out")
+    parser.add_argument("--student_layers", type=int, default=4)
+    parser.add_argument("--student_hidden_size", type=int, default=None,
+                        help="hidden size of the student (default: the teacher's, whose embeddings and evenly "
+                             "spaced layers then initialize the student; other sizes start from random weights)")
+    parser.add_argument("--student_heads", type=int, default=None,
+                        help="number of attention heads of the student (default: the teacher's, or hidden size / 64 "
+                             "for another hidden size)")
+    parser.add_argument("--distill_learning_rate", type=float, default=1e-4,
+                        help="learning rate of the student (--learning_rate is for fine-tuning)")
+    parser.add_argument("--distill_epochs", type=int, default=5,
+                        help="number of epochs of distillation (--num_epochs is for fine-tuning)")
+    parser.add_argument("--distill_temperature", type=float, default=2.0)
+    parser.add_argument("--distill_alpha", type=float, default=0.5,
+                        help="weight of the soft-label loss; 1 - alpha is the weight of the true-label loss")
     parser.add_argument("--learning_rate", type=float, default=5e-5)
     parser.add_argument("--num_epochs", type=int, default=3)
     parser.add_argument("--batch_size", type=int, default=8)
-
-    args = parser.parse_args()
-
+    parser.add_argument("--precision", type=str, default="fp32", choices=["fp32", "bf16"],
+                        help="run the training forward pass in bfloat16 autocast")
+    parser.add_argument("--grad_accum_steps", type=int, default=1,
+                        help="number of batches whose gradients are accumulated per optimizer step")
+    parser.add_argument("--online_augmentation", action="store_true",
+                        help="with --train_augmented, transform and tokenize augmented examples lazily in DataLoader "
+                             "workers, with new perturbations every epoch")
+    parser.add_argument("--augment_ratio", type=float, default=0.2,
+                        help="number of augmented examples per epoch, as a fraction of the training set "
+                             "(above 1, examples are augmented several times)")
+    parser.add_argument("--num_workers", type=int, default=4,
+                        help="DataLoader worker processes for --online_augmentation and --token_store")
+    parser.add_argument("--prefetch_factor", type=int, default=2,
+                        help="batches prefetched by each DataLoader worker")
+    parser.add_argument("--head_only", action="store_true",
+                        help="freeze the encoder: cache its pooled features of each split and train/evaluate only "
+                             "the classification head on them")
+    parser.add_argument("--feature_dir", type=str, default="./features",
+                        help="directory of the cached encoder features used by --head_only")
+    parser.add_argument("--head_epochs", type=int, default=10)
+    parser.add_argument("--head_learning_rate", type=float, default=1e-3)
+    parser.add_argument("--head_batch_size", type=int, default=64)
+    parser.add_argument("--long_document", action="store_true",
+                        help="evaluate on overlapping 512-token windows covering whole reviews, aggregating the "
+                             "window logits per review")
+    parser.add_argument("--window_stride", type=int, default=128,
+                        help="number of overlapping tokens between consecutive windows")
+    parser.add_argument("--window_agg", type=str, default="mean", choices=["mean", "max", "weighted"],
+                        help="how window logits are combined; weighted uses the attended tokens of each window")
+    # One CPU inference variant is compared with the model at a time
+    variant = parser.add_mutually_exclusive_group()
+    variant.add_argument("--quantize", action="store_true",
+                         help="also evaluate a dynamically int8-quantized copy of the model on CPU and compare")
+    variant.add_argument("--export", type=str, default=None, choices=["torchscript", "onnx"],
+                         help="export the model to a TorchScript/ONNX graph, evaluate it on CPU and compare")
+    parser.add_argument("--export_path", type=str, default=None,
+                        help="path of the exported graph (default: inside --model_dir)")
+    parser.add_argument("--save_logits", action="store_true",
+                        help="also write predictions, labels and logits of each evaluation to a .npz file")
+    parser.add_argument("--profile_dir", type=str, default=None,
+                        help="record per-stage timings of the train/eval loops and write JSON summaries here")
+    parser.add_argument("--profile_trace", action="store_true",
+                        help="with --profile_dir, also capture a torch.profiler trace of a window of steps")
+    parser.add_argument("--trace_start", type=int, default=10, help="first step of the profiler trace")
+    parser.add_argument("--trace_steps", type=int, default=5, help="number of steps in the profiler trace")
+    parser.add_argument("--fused_transform", action="store_true",
+                        help="run the transformation stages on a single tokenization pass of each review")
+    parser.add_argument("--synonym_index", type=str, default=None,
+                        help="precomputed synonym index built with synonym_index.py (avoids loading WordNet)")
+    parser.add_argument("--synonym_wordnet_fallback", action="store_true",
+                        help="look up words missing from --synonym_index in WordNet (by default they have no "
+                             "synonyms, so WordNet is never loaded)")
+    parser.add_argument("--synonym_cache_size", type=int, default=50000,
+                        help="number of words kept in the in-memory synonym LRU cache")
+    parser.add_argument("--transform_seed", type=int, default=0,
+                        help="seed of the per-example random generators used by the transformation")
+    parser.add_argument("--num_proc", type=int, default=None,
+                        help="number of worker processes for transformation and tokenization")
+    parser.add_argument("--cache_dir", type=str, default="./cache",
+                        help="directory of the tokenized/transformed dataset cache")
+    parser.add_argument("--no_cache", action="store_true", help="always recompute tokenized/transformed datasets")
+    parser.add_argument("--cache_max_gb", type=float, default=20.0,
+                        help="evict least recently used cache entries beyond this size")
+    parser.add_argument("--prediction_cache", type=str, default=None,
+                        help="SQLite file caching predictions by model and input ids; evaluation then only runs the "
+                             "model on examples it has not predicted before")
+    parser.add_argument("--prediction_cache_max_entries", type=int, default=1000000,
+                        help="evict least recently used predictions beyond this number")
+    parser.add_argument("--token_store", type=str, default=None,
+                        help="export tokenized datasets to memory-mapped token stores in this directory and load "
+                             "batches from them (with --num_workers / --prefetch_factor)")
+    parser.add_argument("--dynamic_padding", action="store_true",
+                        help="tokenize without padding, batch examples of similar length together and pad each "
+                             "batch to its longest sequence (eval predictions are then written in length order)")
+
+    return parser
+
+
+# Run the steps selected by the command line options (see build_parser)
+# timings: Timings of cli.py --timings, which then also reports the tokenizer, dataset and model loading
+def run(args, timings=None):
     global device
     global tokenizer
+    global transform
+    global dataset_cache
+    global feature_store
+    global prediction_cache
+    global padding
+    global window_stride
+    global load_timings
+    load_timings = timings
+
+    # Start the training processes, or join the process group when this is one of them
+    if args.distributed:
+        if not distributed.launched_by_torchrun():
+            distributed.launch(args.nproc_per_node)
+            exit()
+        distributed.init_distributed()
+
+    dataset_cache = DatasetCache(None if args.no_cache else args.cache_dir, max_size_gb=args.cache_max_gb)
+    feature_store = FeatureStore(None if args.no_cache else args.feature_dir)
+    if args.prediction_cache is not None:
+        prediction_cache = PredictionCache(args.prediction_cache, max_entries=args.prediction_cache_max_entries)
+
+    # Transformation used for the augmented and transformed datasets
+    synonym_index = SynonymIndex(args.synonym_index, cache_size=args.synonym_cache_size,
+                                 wordnet_fallback=args.synonym_wordnet_fallback)
+    transform = CustomTransform(fused=args.fused_transform, synonym_index=synonym_index, seed=args.transform_seed)
+
+    if args.dynamic_padding:
+        padding = False
+    window_stride = args.window_stride
+
+    # Load splits individually (and only when first used) to avoid unsupervised split issue
+    dataset = LazySplits()
+
+    # Print a few transformed examples; only needs the test split and the transformation
+    if args.debug_transformation:
+        create_transformed_dataloader(args, dataset, args.debug_transformation)
 
     # Device
-    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-
-    # Load the tokenizer
-    tokenizer = AutoTokenizer.from_pretrained("bert-base-cased")
+    device = torch.device("cuda") if torch.cuda.is_available() and not args.distributed else torch.device("cpu")
 
-    # Tokenize the dataset - load splits individually to avoid unsupervised split issue
-    dataset = {
-        'train': load_dataset("imdb", split='train', ignore_verifications=True),
-        'test': load_dataset("imdb", split='test', ignore_verifications=True)
-    }
-    # Tokenize each split
-    tokenized_dataset = {
-        'train': dataset['train'].map(tokenize_function, batched=True),
-        'test': dataset['test'].map(tokenize_function, batched=True)
-    }
-
-    # Prepare dataset for use by model
-    for split in ['train', 'test']:
-        tokenized_dataset[split] = tokenized_dataset[split].remove_columns(["text"])
-        tokenized_dataset[split] = tokenized_dataset[split].rename_column("label", "labels")
-        tokenized_dataset[split].set_format("torch")
-
-    small_train_dataset = tokenized_dataset["train"].shuffle(seed=42).select(range(4000))
-    small_eval_dataset = tokenized_dataset["test"].shuffle(seed=42).select(range(1000))
+    # Load the tokenizer only if some step tokenizes
+    if args.train or args.train_augmented or args.distill or args.eval or args.eval_transformed or args.sweep:
+        with timed("load tokenizer"):
+            tokenizer = AutoTokenizer.from_pretrained("bert-base-cased")
 
     # A smart way to train it on a small set of data without changing the code in the future
-    # Create dataloaders for iterating over the dataset
+    # The subset is selected before tokenization, so only the examples that are used get tokenized
     if args.debug_train:
-        train_dataloader = DataLoader(small_train_dataset, shuffle=True, batch_size=args.batch_size)
-        eval_dataloader = DataLoader(small_eval_dataset, batch_size=args.batch_size)
         print(f"Debug training...")
-        print(f"len(train_dataloader): {len(train_dataloader)}")
-        print(f"len(eval_dataloader): {len(eval_dataloader)}")
+        train_size, eval_size = 4000, 1000
     else:
-        train_dataloader = DataLoader(tokenized_dataset["train"], shuffle=True, batch_size=args.batch_size)
-        eval_dataloader = DataLoader(tokenized_dataset["test"], batch_size=args.batch_size)
         print(f"Actual training...")
+        train_size, eval_size = None, None
+
+    # Create dataloaders for iterating over the dataset, only for the splits the chosen flags use
+    if args.train:
+        # Head-only training caches features in dataloader order, and shuffles them itself
+        train_dataloader = create_dataloader(args, prepare_split(args, dataset["train"], train_size),
+                                             shuffle=not args.head_only)
         print(f"len(train_dataloader): {len(train_dataloader)}")
+    if args.eval and distributed.is_main_process():
+        eval_dataloader = create_dataloader(args, prepare_split(args, dataset["test"], eval_size,
+                                                                windows=args.long_document))
         print(f"len(eval_dataloader): {len(eval_dataloader)}")
 
+    # Model trained in this run, reused by the evaluation steps instead of reloading it from disk
+    model = None
+
     # Train model on the original training dataset
     if args.train:
-        model = AutoModelForSequenceClassification.from_pretrained("bert-base-cased", num_labels=2)
+        model = load_model("bert-base-cased", num_labels=2)
         model.to(device)
-        do_train(args, model, train_dataloader, save_dir="./out")
+        if args.head_only:
+            # Head-only training is not data-parallel: only the first process extracts features and trains
+            if distributed.is_main_process():
+                do_train_head(args, model, [train_dataloader], save_dir="./out")
+        else:
+            do_train(args, model, train_dataloader, save_dir="./out")
         # Change eval dir
         args.model_dir = "./out"
 
     # Train model on the augmented training dataset
     if args.train_augmented:
-        train_dataloader = create_augmented_dataloader(args, dataset)
-        model = AutoModelForSequenceClassification.from_pretrained("bert-base-cased", num_labels=2)
+        model = load_model("bert-base-cased", num_labels=2)
         model.to(device)
-        do_train(args, model, train_dataloader, save_dir="./out_augmented")
+        if args.head_only and distributed.is_main_process():
+            # Features of the original training split and of the transformed examples are cached
+            # separately, so only the transformed examples are encoded again when the transformation changes
+            train_dataloaders = [
+                create_dataloader(args, prepare_split(args, dataset["train"])),
+                create_dataloader(args, prepare_split(args, create_augmentation_examples(args, dataset))),
+            ]
+            do_train_head(args, model, train_dataloaders, save_dir="./out_augmented")
+        elif not args.head_only:
+            if args.online_augmentation:
+                train_dataloader = create_online_augmented_dataloader(args, dataset)
+            else:
+                train_dataloader = create_augmented_dataloader(args, dataset)
+            do_train(args, model, train_dataloader, save_dir="./out_augmented")
         # Change eval dir
         args.model_dir = "./out_augmented"
 
+    # Distill the fine-tuned model into a smaller student on the original or augmented training dataset
+    if args.distill:
+        if args.distill_data == "augmented":
+            if args.online_augmentation:
+                train_dataloader = create_online_augmented_dataloader(args, dataset)
+            else:
+                train_dataloader = create_augmented_dataloader(args, dataset)
+        else:
+            train_dataloader = create_dataloader(args, prepare_split(args, dataset["train"], train_size), shuffle=True)
+        model = do_distill(args, train_dataloader, save_dir="./out_student")
+        # Change eval dir
+        args.model_dir = "./out_student"
+
+    # Only the first process evaluates
+    if not distributed.is_main_process():
+        exit()
+
     # Evaluate the trained model on the original test dataset
     if args.eval:
         out_file = os.path.basename(os.path.normpath(args.model_dir))
         out_file = out_file + "_original.txt"
-        score = do_eval(eval_dataloader, args.model_dir, out_file)
-        print("Score: ", score)
+        run_eval(args, eval_dataloader, out_file, model=model)
 
     # Evaluate the trained model on the transformed test dataset
     if args.eval_transformed:
         out_file = os.path.basename(os.path.normpath(args.model_dir))
         out_file = out_file + "_transformed.txt"
         eval_transformed_dataloader = create_transformed_dataloader(args, dataset, args.debug_transformation)
-        score = do_eval(eval_transformed_dataloader, args.model_dir, out_file)
-        print("Score: ", score)
+        run_eval(args, eval_transformed_dataloader, out_file, model=model)
+
+    # Evaluate the trained model on the test dataset transformed with every config of the sweep grid
+    if args.sweep:
+        do_sweep(args, dataset, model=model)
+
+
+if __name__ == "__main__":
+    run(build_parser().parse_args())
@@ -0,0 +1,86 @@
+import torch
+
+
+# Streaming classification metrics computed from each batch's tensors, fully offline.
+# update() only does tensor ops (bincount / index_add) on the device the logits live on;
+# compute() returns accuracy, per-class and macro precision/recall/F1, the confusion matrix,
+# the expected calibration error (ECE) of the softmax confidences and the accuracy per
+# review-length bucket (lengths in tokens, e.g. attention_mask.sum(-1)).
+class StreamingMetrics:
+    def __init__(self, num_labels=2, num_bins=15, length_boundaries=(128, 256, 384, 512)):
+        self.num_labels = num_labels
+        self.num_bins = num_bins
+        self.length_boundaries = list(length_boundaries)
+        self.confusion = None
+
+    def _init_state(self, device):
+        num_buckets = len(self.length_boundaries) + 1
+        # confusion[true, predicted]
+        self.confusion = torch.zeros(self.num_labels * self.num_labels, dtype=torch.long, device=device)
+        self.bin_count = torch.zeros(self.num_bins, dtype=torch.long, device=device)
+        self.bin_confidence = torch.zeros(self.num_bins, dtype=torch.float64, device=device)
+        self.bin_correct = torch.zeros(self.num_bins, dtype=torch.float64, device=device)
+        self.bucket_count = torch.zeros(num_buckets, dtype=torch.long, device=device)
+        self.bucket_correct = torch.zeros(num_buckets, dtype=torch.long, device=device)
+        self.boundaries = torch.tensor(self.length_boundaries, device=device)
+
+    def update(self, logits, labels, lengths=None):
+        if self.confusion is None:
+            self._init_state(logits.device)
+        labels = labels.to(logits.device)
+
+        probabilities = torch.softmax(logits.float(), dim=-1)
+        confidence, predictions = probabilities.max(dim=-1)
+        correct = predictions == labels
+
+        self.confusion += torch.bincount(labels * self.num_labels + predictions,
+                                         minlength=self.num_labels * self.num_labels)
+
+        # Confidence bins (i / num_bins, (i + 1) / num_bins]
+        bins = (torch.ceil(confidence * self.num_bins).long() - 1).clamp(0, self.num_bins - 1)
+        self.bin_count += torch.bincount(bins, minlength=self.num_bins)
+        self.bin_confidence.index_add_(0, bins, confidence.double())
+        self.bin_correct.index_add_(0, bins, correct.double())
+
+        if lengths is not None:
+            buckets = torch.bucketize(lengths.to(logits.device), self.boundaries)
+            self.bucket_count += torch.bincount(buckets, minlength=len(self.bucket_count))
+            self.bucket_correct += torch.bincount(buckets, weights=correct.double(),
+                                                  minlength=len(self.bucket_count)).long()
+
+    def compute(self):
+        confusion = self.confusion.view(self.num_labels, self.num_labels).cpu().double()
+        total = confusion.sum().item()
+        true_positives = confusion.diag()
+        predicted = confusion.sum(dim=0)
+        actual = confusion.sum(dim=1)
+
+        precision = torch.where(predicted > 0, true_positives / predicted.clamp(min=1), torch.zeros_like(predicted))
+        recall = torch.where(actual > 0, true_positives / actual.clamp(min=1), torch.zeros_like(actual))
+        f1 = torch.where(precision + recall > 0, 2 * precision * recall / (precision + recall).clamp(min=1e-12),
+                         torch.zeros_like(precision))
+
+        ece = (self.bin_correct - self.bin_confidence).abs().sum().item() / max(total, 1)
+
+        names = [f"<={b}" for b in self.length_boundaries] + [f">{self.length_boundaries[-1]}"]
+        accuracy_by_length = {}
+        for name, count, correct in zip(names, self.bucket_count.tolist(), self.bucket_correct.tolist()):
+            if count > 0:
+                accuracy_by_length[name] = {"accuracy": correct / count, "count": count}
+
+        score = {
+            "accuracy": true_positives.sum().item() / max(total, 1),
+            "precision": precision.tolist(),
+            "recall": recall.tolist(),
+            "f1": f1.tolist(),
+            "macro_f1": f1.mean().item(),
+            "confusion_matrix": confusion.long().tolist(),
+            "ece": ece,
+        }
+        if accuracy_by_length:
+            score["accuracy_by_length"] = accuracy_by_length
+        if self.num_labels == 2:
+            score["binary_precision"] = score["precision"][1]
+            score["binary_recall"] = score["recall"][1]
+            score["binary_f1"] = score["f1"][1]
+        return score
@@ -0,0 +1,123 @@
+import hashlib
+import numpy as np
+import os
+import sqlite3
+import time
+import torch
+
+
+# Content-addressed cache of model outputs in a SQLite file.
+# A prediction is keyed by the model fingerprint (data_cache.module_fingerprint) and the hash of the
+# example's input ids without padding, so an example that comes out of the transformation unchanged,
+# or identical to a previous run, is never run through the same model twice.
+# Entries beyond max_entries are evicted least recently used first.
+class PredictionCache:
+    def __init__(self, path, max_entries=1000000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS predictions "
+                                "(key TEXT PRIMARY KEY, logits BLOB, last_used INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+        self.hits = 0
+        self.misses = 0
+
+    # Key of every row of a batch of (right-padded) input ids
+    def keys(self, model_key, input_ids, attention_mask):
+        lengths = attention_mask.sum(dim=-1).tolist()
+        keys = []
+        for ids, length in zip(input_ids.cpu().numpy().astype(np.int32), lengths):
+            digest = hashlib.sha256(model_key.encode("utf-8"))
+            digest.update(ids[:length].tobytes())
+            keys.append(digest.hexdigest()[:32])
+        return keys
+
+    # Cached logits (float32 arrays) of the keys that are in the cache
+    def get(self, keys):
+        placeholders = ",".join("?" * len(keys))
+        rows = self.connection.execute(f"SELECT key, logits FROM predictions WHERE key IN ({placeholders})",
+                                       keys).fetchall()
+        found = {key: np.frombuffer(logits, dtype=np.float32) for key, logits in rows}
+        if found:
+            self.connection.execute(f"UPDATE predictions SET last_used = ? WHERE key IN "
+                                    f"({','.join('?' * len(found))})", [time.time_ns(), *found])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, keys, logits):
+        now = time.time_ns()
+        rows = [(key, row.astype(np.float32).tobytes(), now) for key, row in zip(keys, logits)]
+        self.connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", rows)
+        self.connection.commit()
+
+    # Remove least recently used entries until at most max_entries are left
+    def evict(self):
+        count = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute("DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                                    "ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+        self.connection.commit()
+
+    def stats(self):
+        size = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size, "max_entries": self.max_entries}
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+# Logits (on CPU) of a stream of batches of CPU tensors: cached rows are read from the cache as each
+# batch comes in, while the missing rows of successive batches are buffered and run through the model
+# batch_size at a time (trimmed to their longest sequence), so that a mostly cached evaluation still
+# runs full batches. add(batch) returns the logits of the batch, whose missing rows are filled in
+# place by a later add() or by flush(), which must be called after the last batch.
+class CachedPredictor:
+    def __init__(self, model, cache, model_key, device, batch_size):
+        self.model = model
+        self.cache = cache
+        self.model_key = model_key
+        self.device = device
+        self.batch_size = batch_size
+        self.pad_token_id = getattr(model.config, "pad_token_id", None) or 0
+        # (logits tensor, row, key, unpadded model inputs of the row) of every buffered miss
+        self.pending = []
+
+    def add(self, batch):
+        keys = self.cache.keys(self.model_key, batch["input_ids"], batch["attention_mask"])
+        found = self.cache.get(keys)
+        logits = torch.empty(len(keys), self.model.config.num_labels)
+        lengths = batch["attention_mask"].sum(dim=-1).tolist()
+        for i, key in enumerate(keys):
+            if key in found:
+                logits[i] = torch.from_numpy(found[key].copy())
+            else:
+                inputs = {k: v[i, :lengths[i]] for k, v in batch.items() if k != "labels"}
+                self.pending.append((logits, i, key, inputs))
+        while len(self.pending) >= self.batch_size:
+            self._run(self.pending[:self.batch_size])
+            self.pending = self.pending[self.batch_size:]
+        return logits
+
+    def flush(self):
+        if self.pending:
+            self._run(self.pending)
+            self.pending = []
+
+    def _run(self, rows):
+        length = max(len(inputs["input_ids"]) for _, _, _, inputs in rows)
+        inputs = {}
+        for name in rows[0][3]:
+            padding_value = self.pad_token_id if name == "input_ids" else 0
+            padded = torch.full((len(rows), length), padding_value, dtype=rows[0][3][name].dtype)
+            for j, (_, _, _, row_inputs) in enumerate(rows):
+                padded[j, :len(row_inputs[name])] = row_inputs[name]
+            inputs[name] = padded.to(self.device)
+        with torch.no_grad():
+            missing_logits = self.model(**inputs).logits.float().cpu()
+        for (logits, i, _, _), row in zip(rows, missing_logits):
+            logits[i] = row
+        self.cache.put([key for _, _, key, _ in rows], missing_logits.numpy())
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import time
+import torch
+
+
+# Per-stage wall time of a training/eval loop.
+# Wrap each stage in `with timer.stage("forward"):` and iterate the dataloader through
+# timer.iterate(...) to time batch loading. On CUDA the device is synchronized around every
+# stage so that asynchronous kernels are attributed to the stage that launched them.
+# When disabled, every method is a no-op.
+class StageTimer:
+    def __init__(self, name, device, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.sync = device.type == "cuda"
+        self.epochs = []
+        self._stages = None
+        self._examples = 0
+        self._steps = 0
+        self._epoch_start = None
+
+    def _now(self):
+        if self.sync:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def start_epoch(self):
+        self._stages = defaultdict(float)
+        self._examples = 0
+        self._steps = 0
+        self._epoch_start = self._now()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = self._now()
+        yield
+        self._stages[name] += self._now() - start
+
+    # Iterate over a dataloader, timing how long each batch takes to arrive as the "data" stage
+    def iterate(self, dataloader):
+        iterator = iter(dataloader)
+        while True:
+            with self.stage("data"):
+                batch = next(iterator, None)
+            if batch is None:
+                return
+            yield batch
+
+    def add_batch(self, num_examples):
+        self._examples += num_examples
+        self._steps += 1
+
+    def end_epoch(self):
+        if not self.enabled:
+            return
+        wall = self._now() - self._epoch_start
+        epoch = {
+            "epoch": len(self.epochs),
+            "wall_time": wall,
+            "steps": self._steps,
+            "examples": self._examples,
+            "examples_per_sec": self._examples / wall if wall > 0 else 0.0,
+            "stages": dict(self._stages),
+            "other": wall - sum(self._stages.values()),
+        }
+        self.epochs.append(epoch)
+        stages = ", ".join(f"{k}={v:.2f}s" for k, v in epoch["stages"].items())
+        print(f"[{self.name}] epoch {epoch['epoch']}: {wall:.2f}s, "
+              f"{epoch['examples_per_sec']:.1f} examples/sec ({stages})")
+
+    def write(self, path):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"name": self.name, "epochs": self.epochs}, f, indent=2)
+
+
+class _NullProfiler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def step(self):
+        pass
+
+
+# torch.profiler capturing trace_steps steps after skipping trace_start steps, written as a
+# Chrome/TensorBoard trace to trace_dir. Returns a no-op profiler when trace_dir is None.
+def make_profiler(trace_dir, trace_start=10, trace_steps=5):
+    if trace_dir is None:
+        return _NullProfiler()
+
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=max(trace_start - 1, 0), warmup=1, active=trace_steps, repeat=1),
+        on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_dir),
+        record_shapes=True,
+    )
@@ -0,0 +1,168 @@
+from itertools import islice
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import torch
+from inference import load_classifier, predict_logits_sorted, predict_logits_windows, format_predictions
+
+csv.field_size_limit(sys.maxsize)
+
+
+def _open_input(path):
+    if path == "-":
+        return sys.stdin
+    return open(path, newline="", encoding="utf-8")
+
+
+# Stream records (dicts with at least text_field) from a JSONL, CSV or plain text file, or stdin ("-")
+def iter_records(path, fmt, text_field):
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower()
+        fmt = {".csv": "csv", ".txt": "text"}.get(extension, "jsonl")
+
+    f = _open_input(path)
+    try:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "text":
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    yield {text_field: line}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+# Offset of the first record an interrupted run did not score: one past the "offset" of the last
+# complete line of its output (start_offset when there is none). A partial last line, left by a run
+# killed mid-write, is truncated so that the resumed run appends after the last complete line.
+def resume_offset(path, start_offset=0):
+    if not os.path.exists(path):
+        return start_offset
+    with open(path, "rb+") as f:
+        # Read back from the end until the tail holds the last complete line
+        tail, position = b"", f.seek(0, os.SEEK_END)
+        while position > 0 and tail.count(b"\n") < 2:
+            size = min(1 << 16, position)
+            position -= size
+            f.seek(position)
+            tail = f.read(size) + tail
+        complete = tail[:tail.rfind(b"\n") + 1]
+        if len(complete) < len(tail):
+            print(f"Truncating a partial line at the end of {path}", file=sys.stderr)
+            f.truncate(position + len(complete))
+    lines = complete.splitlines()
+    if not lines:
+        return start_offset
+    return json.loads(lines[-1])["offset"] + 1
+
+
+# Score records chunk by chunk: only chunk_size records (and their tokens) are in memory at a time,
+# and every chunk's predictions are written and flushed before the next chunk is read
+def score_stream(args, model, tokenizer, device, records, out, start_offset=0):
+    transform = None
+    if args.transform:
+        from utils import CustomTransform
+        transform = CustomTransform(seed=args.transform_seed)
+
+    records = islice(records, start_offset, None)
+    offset = start_offset
+    start = time.perf_counter()
+    while True:
+        chunk = list(islice(records, args.chunk_size))
+        if not chunk:
+            break
+
+        texts = [str(record.get(args.text_field, "")) for record in chunk]
+        if transform is not None:
+            # Seeded by the record offset, so a resumed run transforms records exactly as a full run
+            texts = [transform.transform_text(text, transform.example_rng(offset + i)) for i, text in enumerate(texts)]
+
+        if args.long_document:
+            logits = predict_logits_windows(model, tokenizer, texts, device, batch_size=args.batch_size,
+                                            max_length=args.max_length, stride=args.window_stride,
+                                            method=args.window_agg)
+        else:
+            logits = predict_logits_sorted(model, tokenizer, texts, device, batch_size=args.batch_size,
+                                           max_length=args.max_length)
+        lines = []
+        for i, (record, result) in enumerate(zip(chunk, format_predictions(logits))):
+            result["offset"] = offset + i
+            if args.id_field in record:
+                result["id"] = record[args.id_field]
+            lines.append(json.dumps(result))
+        out.write("\n".join(lines) + "\n")
+        out.flush()
+
+        offset += len(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"Scored {offset} records ({(offset - start_offset) / elapsed:.1f} records/sec)", file=sys.stderr)
+    return offset
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="-", help="JSONL/CSV/text file, or - for stdin")
+    parser.add_argument("--format", type=str, default=None, choices=["jsonl", "csv", "text"],
+                        help="input format (default: from the file extension, JSONL for stdin)")
+    parser.add_argument("--output", type=str, default="-", help="JSONL predictions file, or - for stdout")
+    parser.add_argument("--text_field", type=str, default="text")
+    parser.add_argument("--id_field", type=str, default="id")
+    parser.add_argument("--model_dir", type=str, default="./out")
+    parser.add_argument("--tokenizer", type=str, default="bert-base-cased")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--chunk_size", type=int, default=2048,
+                        help="number of records read, tokenized and scored at a time")
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--long_document", action="store_true",
+                        help="score whole records as overlapping windows of max_length tokens instead of truncating")
+    parser.add_argument("--window_stride", type=int, default=128)
+    parser.add_argument("--window_agg", type=str, default="mean", choices=["mean", "max", "weighted"])
+    parser.add_argument("--transform", action="store_true", help="apply the custom transformation before scoring")
+    parser.add_argument("--transform_seed", type=int, default=0)
+    parser.add_argument("--start_offset", type=int, default=0, help="skip this many input records")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to --output, continuing after the last record it holds "
+                             "(from --start_offset if it holds none)")
+    parser.add_argument("--quantize", action="store_true", help="score with a dynamically int8-quantized model")
+    parser.add_argument("--cpu", action="store_true", help="run on CPU even if CUDA is available")
+    return parser
+
+
+# Parse and check the command line (argv defaults to sys.argv[1:])
+def parse_args(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.resume and args.output == "-":
+        parser.error("--resume needs an --output file")
+    return args
+
+
+def main(args):
+    start_offset = args.start_offset
+    if args.resume:
+        start_offset = resume_offset(args.output, args.start_offset)
+        print(f"Resuming at record {start_offset}", file=sys.stderr)
+
+    device = torch.device("cuda") if torch.cuda.is_available() and not args.cpu else torch.device("cpu")
+    model, tokenizer, device = load_classifier(args.model_dir, args.tokenizer, device, quantize=args.quantize)
+
+    records = iter_records(args.input, args.format, args.text_field)
+    out = sys.stdout if args.output == "-" else open(args.output, "a" if args.resume else "w")
+    try:
+        score_stream(args, model, tokenizer, device, records, out, start_offset)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,215 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import sys
+import time
+import torch
+from inference import load_classifier, predict_logits, predict_logits_windows, format_predictions
+
+
+# Gathers concurrent requests into micro-batches of at most max_batch_size texts, waiting at most
+# max_wait_ms after the first request of a batch for more to arrive. Batches run one at a time on a
+# worker thread so that the event loop keeps accepting requests while the model is busy.
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=10.0, latency_window=10000):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_queue_depth = 0
+
+    async def submit(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future, time.perf_counter()))
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_fn, texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_texts += len(batch)
+            now = time.perf_counter()
+            for (_, future, start), result in zip(batch, results):
+                self.latencies.append(now - start)
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "latency_ms": {"p50": percentile(50), "p90": percentile(90), "p99": percentile(99)},
+        }
+
+
+def _http_response(writer, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+
+
+# Minimal HTTP/1.1 handler:
+#   POST /predict  {"text": "..."} or {"texts": ["...", ...]}
+#   GET  /stats    latency percentiles, queue depth and batch counters
+#   GET  /health
+async def handle_http(batcher, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        if len(request_line) < 2:
+            _http_response(writer, 400, {"error": "malformed request"})
+        elif request_line[0] == "GET" and request_line[1] == "/stats":
+            _http_response(writer, 200, batcher.stats())
+        elif request_line[0] == "GET" and request_line[1] == "/health":
+            _http_response(writer, 200, {"status": "ok"})
+        elif request_line[0] == "POST" and request_line[1] == "/predict":
+            payload = json.loads(body or b"{}")
+            if "texts" in payload:
+                results = await asyncio.gather(*(batcher.submit(text) for text in payload["texts"]))
+                _http_response(writer, 200, {"predictions": list(results)})
+            elif "text" in payload:
+                _http_response(writer, 200, await batcher.submit(payload["text"]))
+            else:
+                _http_response(writer, 400, {"error": "expected 'text' or 'texts'"})
+        else:
+            _http_response(writer, 404, {"error": "not found"})
+    except ValueError as e:
+        _http_response(writer, 400, {"error": str(e)})
+    except Exception as e:
+        _http_response(writer, 500, {"error": str(e)})
+    finally:
+        await writer.drain()
+        writer.close()
+
+
+# Reads one review per line from stdin (raw text or {"id": ..., "text": ...}) and writes one JSON
+# result per line as soon as it is ready; lines are scored concurrently so they share micro-batches
+async def serve_stdin(batcher):
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def answer(line_number, line):
+        try:
+            payload = json.loads(line) if line.startswith("{") else {"text": line}
+            result = await batcher.submit(payload["text"])
+            result["id"] = payload.get("id", line_number)
+        except Exception as e:
+            result = {"id": line_number, "error": str(e)}
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+    line_number = 0
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        line = line.rstrip("\n")
+        if line:
+            task = asyncio.create_task(answer(line_number, line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        line_number += 1
+
+    if pending:
+        await asyncio.gather(*pending)
+    print(json.dumps({"stats": batcher.stats()}), file=sys.stderr)
+
+
+async def main(args):
+    device = torch.device("cuda") if torch.cuda.is_available() and not args.cpu else torch.device("cpu")
+    model, tokenizer, device = load_classifier(args.model_dir, args.tokenizer, device, quantize=args.quantize)
+
+    def predict(texts):
+        if args.long_document:
+            logits = predict_logits_windows(model, tokenizer, texts, device, batch_size=args.max_batch_size,
+                                            max_length=args.max_length, stride=args.window_stride,
+                                            method=args.window_agg)
+        else:
+            logits = predict_logits(model, tokenizer, texts, device, max_length=args.max_length)
+        return format_predictions(logits)
+
+    batcher = MicroBatcher(predict, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    worker = asyncio.create_task(batcher.run())
+
+    if args.stdin:
+        await serve_stdin(batcher)
+    else:
+        server = await asyncio.start_server(lambda r, w: handle_http(batcher, r, w), args.host, args.port)
+        print(f"Serving {args.model_dir} on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+    worker.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, default="./out")
+    parser.add_argument("--tokenizer", type=str, default="bert-base-cased")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--stdin", action="store_true", help="read reviews from stdin instead of serving HTTP")
+    parser.add_argument("--max_batch_size", type=int, default=32)
+    parser.add_argument("--max_wait_ms", type=float, default=10.0,
+                        help="how long the first request of a batch waits for more requests")
+    parser.add_argument("--max_length", type=int, default=512)
+    parser.add_argument("--long_document", action="store_true",
+                        help="score whole reviews as overlapping windows of max_length tokens instead of truncating")
+    parser.add_argument("--window_stride", type=int, default=128)
+    parser.add_argument("--window_agg", type=str, default="mean", choices=["mean", "max", "weighted"])
+    parser.add_argument("--quantize", action="store_true", help="serve a dynamically int8-quantized model on CPU")
+    parser.add_argument("--cpu", action="store_true", help="run on CPU even if CUDA is available")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,124 @@
+from functools import lru_cache
+from nltk.corpus import wordnet
+import argparse
+import hashlib
+import pickle
+
+
+# All single-word WordNet synonyms of a (lowercase) word, deduplicated in order
+def wordnet_synonyms(word_lower):
+    # Get all synonyms from all synsets
+    synonyms = []
+    for syn in wordnet.synsets(word_lower):
+        for lemma in syn.lemmas():
+            synonym = lemma.name().replace('_', ' ')
+            # Filter out the original word and very different forms
+            if synonym.lower() != word_lower and len(synonym.split()) == 1:
+                synonyms.append(synonym)
+
+    # Remove duplicates while preserving order
+    seen = set()
+    unique_synonyms = []
+    for syn in synonyms:
+        if syn.lower() not in seen:
+            seen.add(syn.lower())
+            unique_synonyms.append(syn)
+    return tuple(unique_synonyms)
+
+
+# Synonym lookup with a bounded in-memory LRU, optionally backed by a precomputed
+# vocabulary -> synonyms index (see build_synonym_index). With an index, WordNet is never loaded:
+# words missing from the index have no synonyms, unless wordnet_fallback looks them up in WordNet.
+# Without an index, every word is looked up in WordNet (loaded lazily by nltk).
+class SynonymIndex:
+    def __init__(self, index_path=None, cache_size=50000, wordnet_fallback=False):
+        self.index_path = index_path
+        self.cache_size = cache_size
+        self.wordnet_fallback = wordnet_fallback
+        self.index = None
+        self.index_digest = None
+        if index_path is not None:
+            with open(index_path, "rb") as f:
+                data = f.read()
+            self.index = pickle.loads(data)
+            self.index_digest = hashlib.sha256(data).hexdigest()[:16]
+        self.index_hits = 0
+        self.index_misses = 0
+        self._lookup = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def _resolve(self, word_lower):
+        if self.index is not None:
+            synonyms = self.index.get(word_lower)
+            if synonyms is not None:
+                self.index_hits += 1
+                return synonyms
+            self.index_misses += 1
+            if not self.wordnet_fallback:
+                return ()
+        return wordnet_synonyms(word_lower)
+
+    def __call__(self, word_lower):
+        return self._lookup(word_lower)
+
+    # Where synonyms come from, for cache keys: None for WordNet alone, otherwise the content hash
+    # of the index and whether words missing from it are looked up in WordNet
+    def source(self):
+        if self.index is None:
+            return None
+        return {"index": self.index_digest, "wordnet_fallback": self.wordnet_fallback}
+
+    # Hit/miss counters of the LRU and of the on-disk index, to help size them
+    def stats(self):
+        info = self._lookup.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "index_hits": self.index_hits,
+            "index_misses": self.index_misses,
+        }
+
+    # The lru_cache wrapper cannot be pickled (e.g. for datasets.map workers); rebuild it instead
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lookup"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lookup = lru_cache(maxsize=self.cache_size)(self._resolve)
+
+
+# Precompute the synonyms of every word of texts that transform may look up and pickle the table to
+# path. The vocabulary uses the transformation's own tokenization, after the acronym stage
+# (CustomTransform.synonym_candidates). Words without synonyms are stored too, so that they are index
+# hits as well.
+def build_synonym_index(texts, path, transform=None):
+    if transform is None:
+        from utils import CustomTransform
+        transform = CustomTransform()
+    vocabulary = set()
+    for text in texts:
+        vocabulary.update(transform.synonym_candidates(text))
+
+    index = {word: wordnet_synonyms(word) for word in sorted(vocabulary)}
+    with open(path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+
+if __name__ == "__main__":
+    from datasets import load_dataset
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", type=str, default="./synonym_index.pkl")
+    args = parser.parse_args()
+
+    # Build the index from the vocabulary of both IMDB splits
+    texts = []
+    for split in ["train", "test"]:
+        texts.extend(load_dataset("imdb", split=split, ignore_verifications=True)["text"])
+
+    index = build_synonym_index(texts, args.out)
+    print(f"Wrote {len(index)} words to {args.out}")
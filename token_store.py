@@ -0,0 +1,111 @@
+from torch.utils.data import Dataset
+from data_cache import store_entry
+import json
+import numpy as np
+import os
+import torch
+
+# Bump when the layout of token stores changes
+TOKEN_STORE_VERSION = 1
+
+
+# Write the examples of a tokenized dataset (input_ids, attention_mask, labels and, for
+# --long_document windows, review_id) to path as flat arrays: the unpadded token ids of all examples
+# back to back (input_ids.bin, int32), offsets of every example into them (N + 1), token lengths
+# and labels. The attention mask is all ones over each example's length, so it is not stored.
+def export_token_store(dataset, path, pad_token_id, chunk_size=10000):
+    dataset = dataset.with_format(None)
+    has_review_ids = "review_id" in dataset.column_names
+    lengths, labels, review_ids = [], [], []
+    num_tokens = 0
+    with open(os.path.join(path, "input_ids.bin"), "wb") as f:
+        for start in range(0, len(dataset), chunk_size):
+            chunk = dataset[start:start + chunk_size]
+            for i, input_ids in enumerate(chunk["input_ids"]):
+                # Right-padded (padding="max_length") or unpadded (--dynamic_padding) sequences
+                length = sum(chunk["attention_mask"][i])
+                f.write(np.asarray(input_ids[:length], dtype=np.int32).tobytes())
+                lengths.append(length)
+                num_tokens += length
+            labels.extend(chunk["labels"])
+            if has_review_ids:
+                review_ids.extend(chunk["review_id"])
+
+    lengths = np.asarray(lengths, dtype=np.int32)
+    np.save(os.path.join(path, "lengths.npy"), lengths)
+    np.save(os.path.join(path, "offsets.npy"), np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]))
+    np.save(os.path.join(path, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    if has_review_ids:
+        np.save(os.path.join(path, "review_ids.npy"), np.asarray(review_ids, dtype=np.int64))
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"version": TOKEN_STORE_VERSION, "num_examples": len(lengths), "num_tokens": num_tokens,
+                   "pad_token_id": pad_token_id, "has_review_ids": has_review_ids}, f)
+
+
+# Dataset over a token store whose items are whole batches: store[indices] slices the examples
+# straight out of the memory-mapped arrays and pads them to the longest one, so a DataLoader with
+# batch_size=None and a batch sampler gets ready tensors without per-example conversions.
+# The arrays are opened read-only and lazily (also after pickling to DataLoader workers), so all
+# processes reading the same store on a host share it through the page cache.
+class TokenStore(Dataset):
+    def __init__(self, path):
+        self.path = path
+        # Fingerprint of the exported dataset, like datasets.Dataset._fingerprint
+        self._fingerprint = os.path.basename(os.path.normpath(path))
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.lengths = np.load(os.path.join(path, "lengths.npy"))
+        self._arrays = None
+
+    def _open(self):
+        if self._arrays is None:
+            arrays = {
+                "input_ids": np.memmap(os.path.join(self.path, "input_ids.bin"), dtype=np.int32, mode="r",
+                                       shape=(max(self.meta["num_tokens"], 1),)),
+                "offsets": np.load(os.path.join(self.path, "offsets.npy"), mmap_mode="r"),
+                "labels": np.load(os.path.join(self.path, "labels.npy"), mmap_mode="r"),
+            }
+            if self.meta["has_review_ids"]:
+                arrays["review_ids"] = np.load(os.path.join(self.path, "review_ids.npy"), mmap_mode="r")
+            self._arrays = arrays
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __len__(self):
+        return self.meta["num_examples"]
+
+    def __getitem__(self, indices):
+        arrays = self._open()
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices].astype(np.int64)
+        positions = np.arange(lengths.max())
+        mask = positions[None, :] < lengths[:, None]
+        # Token positions of every (example, position) pair; padding positions read the first
+        # token of the example and are then overwritten
+        token_index = arrays["offsets"][indices][:, None] + np.where(mask, positions[None, :], 0)
+        input_ids = np.where(mask, np.asarray(arrays["input_ids"][token_index]), self.meta["pad_token_id"])
+
+        batch = {
+            "input_ids": torch.from_numpy(input_ids.astype(np.int64)),
+            "attention_mask": torch.from_numpy(mask.astype(np.int64)),
+            "labels": torch.from_numpy(np.asarray(arrays["labels"][indices])),
+        }
+        if "review_ids" in arrays:
+            batch["review_id"] = torch.from_numpy(np.asarray(arrays["review_ids"][indices]))
+        return batch
+
+
+# Token store of a tokenized dataset under root, exported on first use. Stores are keyed by the
+# dataset fingerprint, which covers the tokenizer, padding and any subset or transformation.
+def load_token_store(root, dataset, pad_token_id):
+    path = os.path.join(root, dataset._fingerprint)
+    if not os.path.isdir(path):
+        os.makedirs(root, exist_ok=True)
+        store_entry(path, lambda tmp_path: export_token_store(dataset, tmp_path, pad_token_id))
+    else:
+        print(f"Loading token store from {path}")
+    return TokenStore(path)
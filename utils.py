@@ -1,23 +1,66 @@
-import datasets
-from datasets import load_dataset
-from transformers import AutoTokenizer
-from torch.utils.data import DataLoader
-from transformers import AutoModelForSequenceClassification
-from torch.optim import AdamW
-from transformers import get_scheduler
-import torch
-from tqdm.auto import tqdm
-import evaluate
 import random
-import argparse
-from nltk.corpus import wordnet
-from nltk import word_tokenize
+from nltk import word_tokenize, sent_tokenize
+from nltk.tokenize.destructive import NLTKWordTokenizer
 from nltk.tokenize.treebank import TreebankWordDetokenizer
 import re
+from types import MappingProxyType
+from synonym_index import SynonymIndex
 
 random.seed(0)
 
 
+# Batch sampler that groups examples of similar length into the same batch so that dynamic
+# padding only pads each batch to its own longest sequence.
+# For training, indices are shuffled, split into buckets of bucket_size_multiplier batches,
+# sorted by length inside each bucket, and the resulting batches are shuffled again.
+# For evaluation, all examples are simply sorted by length.
+# For distributed training, every process (rank out of num_replicas) builds the same batches and
+# takes every num_replicas-th one, the list being padded so that all processes get as many batches.
+class LengthBucketBatchSampler:
+    def __init__(self, lengths, batch_size, shuffle=False, bucket_size_multiplier=100, seed=0, num_replicas=1,
+                 rank=0):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    # Called by the training loop so every epoch gets a different (but reproducible) order
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        indices = list(range(len(self.lengths)))
+        if not self.shuffle:
+            indices.sort(key=lambda i: self.lengths[i])
+            return [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+
+        rng = random.Random(self.seed + self.epoch)
+        rng.shuffle(indices)
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[start:start + self.bucket_size], key=lambda i: self.lengths[i])
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        batches = self._batches()
+        if self.shuffle:
+            self.epoch += 1
+        if self.num_replicas > 1:
+            batches += batches[:len(self) * self.num_replicas - len(batches)]
+            batches = batches[self.rank::self.num_replicas]
+        return iter(batches)
+
+    def __len__(self):
+        num_batches = (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        return (num_batches + self.num_replicas - 1) // self.num_replicas
+
+
 def example_transform(example):
     example["text"] = example["text"].lower()
     return example
@@ -30,24 +73,16 @@ def example_transform(example):
 
 
 ### Rough guidelines --- synonym replacement
-# For synonyms, use can rely on wordnet (already imported here). Wordnet (https://www.nltk.org/howto/wordnet.html) includes
+# For synonyms, use can rely on wordnet (looked up through synonym_index.py). Wordnet (https://www.nltk.org/howto/wordnet.html) includes
 # something called synsets (which stands for synonymous words) and for each of them, lemmas() should give you a possible synonym word.
 # You can randomly select each word with some fixed probability to replace by a synonym.
 
 
-def custom_transform(example):
-    ################################
-    ##### YOUR CODE BEGINGS HERE ###
-
-    # Design and implement the transformation as mentioned in pdf
-    # You are free to implement any transformation but the comments at the top roughly describe
-    # how you could implement two of them --- synonym replacement and typos.
-
-    # You should update example["text"] using your transformation
-
+# Bump when the output of CustomTransform changes for the same parameters and seed
+TRANSFORM_VERSION = 2
 
-    # 1. Phrase -> acronym mapping.
-    PHRASE_TO_ACRONYM = {
+# 1. Phrase -> acronym mapping.
+PHRASE_TO_ACRONYM = MappingProxyType({
     # Places and orgs
     "united states": "US",
     "new york city": "NYC",
@@ -78,7 +113,7 @@ def custom_transform(example):
     "science fiction": "sci-fi",
     "point of view": "POV",
 
-    # Movie titles 
+    # Movie titles
     "the zombie chronicles": "TZC",
     "camp blood": "CB",
     "love's abiding joy": "LAJ",
@@ -96,240 +131,313 @@ def custom_transform(example):
     "close encounters of the third kind": "CE3K",
     "final justice": "FJ",
     "satan's cheerleaders": "SC",
-    }
-    # Ensure keys are lowercase (defensive)
-    _lower_map = {k.lower(): v for k, v in PHRASE_TO_ACRONYM.items()}
-
-    # Sort phrases by length so longer phrases match first
-    phrases_sorted = sorted(_lower_map.keys(), key=len, reverse=True)
-    # Build regex pattern that matches any phrase as a whole "word chunk"
-    # re.escape handles apostrophes, colons, etc.
-    pattern = re.compile(
-        r"\b(" + "|".join(map(re.escape, phrases_sorted)) + r")\b",
-        re.IGNORECASE,
-    )
-
-    def _repl(match: re.Match) -> str:
-        phrase = match.group(0)
-        return _lower_map[phrase.lower()]
-
-    # Apply transformation to the text field
-    example["text"] = pattern.sub(_repl, example["text"])
-
-    # 2. Synonym replacement - replace words with their synonyms
-    SYNONYM_PROBABILITY = 0.25  # 25% chance per word to be replaced
-    
-    def replace_synonyms(text):
+})
+
+# 2. Synonym replacement - replace words with their synonyms
+SYNONYM_PROBABILITY = 0.25  # 25% chance per word to be replaced
+
+# 3. Typo transformation - simulate keyboard typos
+# QWERTY keyboard layout and nearest keys
+QWERTY_NEIGHBORS = MappingProxyType({
+    'a': ('q', 'w', 's', 'z'),
+    'b': ('v', 'g', 'h', 'n'),
+    'c': ('x', 'd', 'f', 'v'),
+    'd': ('s', 'e', 'r', 'f', 'c', 'x'),
+    'e': ('w', 'r', 'd', 's'),
+    'f': ('d', 'r', 't', 'g', 'v', 'c'),
+    'g': ('f', 't', 'y', 'h', 'b', 'v'),
+    'h': ('g', 'y', 'u', 'j', 'n', 'b'),
+    'i': ('u', 'o', 'k', 'j'),
+    'j': ('h', 'u', 'i', 'k', 'm', 'n'),
+    'k': ('j', 'i', 'o', 'l', 'm'),
+    'l': ('k', 'o', 'p'),
+    'm': ('n', 'j', 'k', 'l'),
+    'n': ('b', 'h', 'j', 'm'),
+    'o': ('i', 'p', 'l', 'k'),
+    'p': ('o', 'l'),
+    'q': ('w', 'a'),
+    'r': ('e', 't', 'f', 'd'),
+    's': ('a', 'w', 'e', 'd', 'x', 'z'),
+    't': ('r', 'y', 'g', 'f'),
+    'u': ('y', 'i', 'j', 'h'),
+    'v': ('c', 'f', 'g', 'b'),
+    'w': ('q', 'e', 's', 'a'),
+    'x': ('z', 's', 'd', 'c'),
+    'y': ('t', 'u', 'h', 'g'),
+    'z': ('a', 's', 'x'),
+})
+
+# Probability of introducing a typo in a word
+TYPO_PROBABILITY = 0.30  # 30% chance per word (increased from 15%)
+# Probability of replacing a letter within a selected word
+LETTER_REPLACE_PROB = 0.20  # 20% chance per letter in selected word
+
+# 4. Filler / hedging phrases transformation - using internet slang
+FILLER_PHRASES = (
+    "tbh",  # to be honest
+    "imo",  # in my opinion
+    "imho",  # in my humble opinion
+    "ngl",  # not gonna lie
+    "fr",  # for real
+    "frfr",  # for real for real
+    "lowkey",
+    "highkey",
+    "deadass",
+    "no cap",
+    "ong",  # on god
+    "istg",  # I swear to god
+)
+# Fillers inserted before intensity words
+INTENSITY_FILLERS = ("lowkey", "highkey", "fr", "ngl", "tbh", "deadass")
+# Common intensity words: "very", "really", "extremely", etc.
+INTENSITY_WORDS = frozenset(["very", "really", "extremely", "incredibly", "absolutely",
+                             "completely", "totally", "quite", "rather", "pretty"])
+
+# Probability of inserting a filler phrase
+FILLER_PROBABILITY = 0.40  # 40% chance per sentence (increased from 25%)
+# Probability of inserting before adjectives/adverbs
+BEFORE_WORD_PROB = 0.25  # 25% chance before certain words (increased from 15%)
+
+SENTENCE_SPLIT_PATTERN = re.compile(r'([.!?]+)')
+NON_WORD_PATTERN = re.compile(r'[^\w]')
+
+
+# The custom transformation, built once and reused for every example.
+# All lookup tables and regexes are prepared in __init__, so calling the object (one example) or
+# batch (a batch of examples, for datasets.map(..., batched=True)) only does the per-text work.
+# Random draws happen in exactly the same order as the original per-example implementation,
+# so the output for a given seed is unchanged.
+# When example indices are given (datasets.map(..., with_indices=True)), every example draws from
+# its own random.Random seeded from (seed, index) instead of the global random module, so the
+# output does not depend on the order or the process in which examples are transformed.
+# With fused=True the text is tokenized once (sentence by sentence), every stage works on that
+# token stream, and the text is detokenized once at the end. The output is close to, but not
+# identical with, the default three-pass pipeline.
+class CustomTransform:
+    def __init__(self, synonym_probability=SYNONYM_PROBABILITY, typo_probability=TYPO_PROBABILITY,
+                 letter_replace_prob=LETTER_REPLACE_PROB, filler_probability=FILLER_PROBABILITY,
+                 before_word_prob=BEFORE_WORD_PROB, fused=False, synonym_index=None, seed=0):
+        self.synonym_probability = synonym_probability
+        self.typo_probability = typo_probability
+        self.letter_replace_prob = letter_replace_prob
+        self.filler_probability = filler_probability
+        self.before_word_prob = before_word_prob
+        self.fused = fused
+        self.seed = seed
+        # Cached synonym lookup, optionally backed by a precomputed index
+        self.synonym_index = synonym_index if synonym_index is not None else SynonymIndex()
+
+        # Ensure keys are lowercase (defensive)
+        self._lower_map = {k.lower(): v for k, v in PHRASE_TO_ACRONYM.items()}
+        # Sort phrases by length so longer phrases match first
+        phrases_sorted = sorted(self._lower_map.keys(), key=len, reverse=True)
+        # Build regex pattern that matches any phrase as a whole "word chunk"
+        # re.escape handles apostrophes, colons, etc.
+        self._acronym_pattern = re.compile(
+            r"\b(" + "|".join(map(re.escape, phrases_sorted)) + r")\b",
+            re.IGNORECASE,
+        )
+        self._detokenizer = TreebankWordDetokenizer()
+
+        # Token-level acronym table for the fused pipeline: tokenized phrase -> acronym
+        self._word_tokenizer = NLTKWordTokenizer()
+        self._acronym_tokens = {
+            tuple(self._word_tokenizer.tokenize(phrase)): acronym for phrase, acronym in self._lower_map.items()
+        }
+        self._acronym_lengths = sorted({len(phrase) for phrase in self._acronym_tokens}, reverse=True)
+
+    # Parameters that determine the output, e.g. for cache keys
+    def config(self):
+        return {
+            "version": TRANSFORM_VERSION,
+            "synonym_probability": self.synonym_probability,
+            "typo_probability": self.typo_probability,
+            "letter_replace_prob": self.letter_replace_prob,
+            "filler_probability": self.filler_probability,
+            "before_word_prob": self.before_word_prob,
+            "fused": self.fused,
+            "seed": self.seed,
+            "synonyms": self.synonym_index.source(),
+        }
+
+    def _acronym_repl(self, match):
+        return self._lower_map[match.group(0).lower()]
+
+    def replace_acronyms(self, text):
+        return self._acronym_pattern.sub(self._acronym_repl, text)
+
+    def replace_synonym(self, word, rng=random):
+        # Skip if not a word (punctuation, etc.) and short words
+        if word.isalpha() and len(word) >= 3 and rng.random() < self.synonym_probability:
+            unique_synonyms = self.synonym_index(word.lower())
+            if unique_synonyms:
+                # Pick a random synonym
+                replacement = rng.choice(unique_synonyms)
+                # Preserve case
+                if word[0].isupper():
+                    replacement = replacement.capitalize()
+                return replacement
+        return word
+
+    def replace_synonyms(self, text, rng=random):
         words = word_tokenize(text)
-        transformed_words = []
-        
-        for word in words:
-            # Skip if not a word (punctuation, etc.)
-            if not word.isalpha() or len(word) < 3:  # Skip short words
-                transformed_words.append(word)
-                continue
-            
-            # Decide if we should replace this word with a synonym
-            if random.random() < SYNONYM_PROBABILITY:
-                word_lower = word.lower()
-                # Get synsets for the word
-                synsets = wordnet.synsets(word_lower)
-                
-                if synsets:
-                    # Get all synonyms from all synsets
-                    synonyms = []
-                    for syn in synsets:
-                        for lemma in syn.lemmas():
-                            synonym = lemma.name().replace('_', ' ')
-                            # Filter out the original word and very different forms
-                            if synonym.lower() != word_lower and len(synonym.split()) == 1:
-                                synonyms.append(synonym)
-                    
-                    # Remove duplicates while preserving order
-                    seen = set()
-                    unique_synonyms = []
-                    for syn in synonyms:
-                        if syn.lower() not in seen:
-                            seen.add(syn.lower())
-                            unique_synonyms.append(syn)
-                    
-                    if unique_synonyms:
-                        # Pick a random synonym
-                        replacement = random.choice(unique_synonyms)
-                        # Preserve case
-                        if word[0].isupper():
-                            replacement = replacement.capitalize()
-                        transformed_words.append(replacement)
-                        continue
-            
-            transformed_words.append(word)
-        
-        # Reconstruct text using detokenizer
-        detokenizer = TreebankWordDetokenizer()
-        return detokenizer.detokenize(transformed_words)
-    
-    # Apply synonym replacement
-    example["text"] = replace_synonyms(example["text"])
-
-    # 3. Typo transformation - simulate keyboard typos
-    # Define QWERTY keyboard layout and nearest keys
-    QWERTY_NEIGHBORS = {
-        'a': ['q', 'w', 's', 'z'],
-        'b': ['v', 'g', 'h', 'n'],
-        'c': ['x', 'd', 'f', 'v'],
-        'd': ['s', 'e', 'r', 'f', 'c', 'x'],
-        'e': ['w', 'r', 'd', 's'],
-        'f': ['d', 'r', 't', 'g', 'v', 'c'],
-        'g': ['f', 't', 'y', 'h', 'b', 'v'],
-        'h': ['g', 'y', 'u', 'j', 'n', 'b'],
-        'i': ['u', 'o', 'k', 'j'],
-        'j': ['h', 'u', 'i', 'k', 'm', 'n'],
-        'k': ['j', 'i', 'o', 'l', 'm'],
-        'l': ['k', 'o', 'p'],
-        'm': ['n', 'j', 'k', 'l'],
-        'n': ['b', 'h', 'j', 'm'],
-        'o': ['i', 'p', 'l', 'k'],
-        'p': ['o', 'l'],
-        'q': ['w', 'a'],
-        'r': ['e', 't', 'f', 'd'],
-        's': ['a', 'w', 'e', 'd', 'x', 'z'],
-        't': ['r', 'y', 'g', 'f'],
-        'u': ['y', 'i', 'j', 'h'],
-        'v': ['c', 'f', 'g', 'b'],
-        'w': ['q', 'e', 's', 'a'],
-        'x': ['z', 's', 'd', 'c'],
-        'y': ['t', 'u', 'h', 'g'],
-        'z': ['a', 's', 'x'],
-    }
-    
-    # Probability of introducing a typo in a word
-    TYPO_PROBABILITY = 0.30  # 30% chance per word (increased from 15%)
-    # Probability of replacing a letter within a selected word
-    LETTER_REPLACE_PROB = 0.20  # 50% chance per letter in selected word (increased from 30%)
-    
-    def introduce_typos(text):
-        # Tokenize into words while preserving structure
+        return self._detokenizer.detokenize([self.replace_synonym(word, rng) for word in words])
+
+    # Lowercase words of text that replace_synonym may look up, in the standard and the fused
+    # pipelines (tokenized after the acronym stage); the vocabulary of build_synonym_index
+    def synonym_candidates(self, text):
+        words = set(word_tokenize(self.replace_acronyms(text)))
+        for sentence in self.tokenize_sentences(text):
+            words.update(self._fused_acronyms(sentence))
+        return {word.lower() for word in words if word.isalpha() and len(word) >= 3}
+
+    def introduce_typo(self, word, rng=random):
+        # Skip if not a word (punctuation, etc.)
+        if not word.isalpha() or rng.random() >= self.typo_probability:
+            return word
+
+        # Try to replace letters with nearby keyboard keys
+        word_chars = list(word)
+        for i, char in enumerate(word_chars):
+            neighbors = QWERTY_NEIGHBORS.get(char.lower())
+            if neighbors and rng.random() < self.letter_replace_prob:
+                # Pick a random neighbor, preserving case
+                replacement = rng.choice(neighbors)
+                if char.isupper():
+                    replacement = replacement.upper()
+                word_chars[i] = replacement
+        return ''.join(word_chars)
+
+    def introduce_typos(self, text, rng=random):
         words = word_tokenize(text)
-        transformed_words = []
-        
-        for word in words:
-            # Skip if not a word (punctuation, etc.)
-            if not word.isalpha():
-                transformed_words.append(word)
-                continue
-            
-            # Decide if we should introduce typos in this word
-            if random.random() < TYPO_PROBABILITY:
-                word_chars = list(word)
-                has_typo = False
-                
-                # Try to replace letters with nearby keyboard keys
-                for i, char in enumerate(word_chars):
-                    char_lower = char.lower()
-                    # Only process alphabetic characters
-                    if char_lower.isalpha() and char_lower in QWERTY_NEIGHBORS:
-                        if random.random() < LETTER_REPLACE_PROB:
-                            # Get nearby keys
-                            neighbors = QWERTY_NEIGHBORS[char_lower]
-                            if neighbors:
-                                # Pick a random neighbor
-                                replacement = random.choice(neighbors)
-                                # Preserve case
-                                if char.isupper():
-                                    replacement = replacement.upper()
-                                word_chars[i] = replacement
-                                has_typo = True
-                
-                # If we made a typo, reconstruct the word
-                if has_typo:
-                    transformed_words.append(''.join(word_chars))
-                else:
-                    transformed_words.append(word)
-            else:
-                transformed_words.append(word)
-        
-        # Reconstruct text using detokenizer
-        detokenizer = TreebankWordDetokenizer()
-        return detokenizer.detokenize(transformed_words)
-    
-    # Apply typo transformation
-    example["text"] = introduce_typos(example["text"])
-
-    # 3. Filler / hedging phrases transformation - using internet slang
-    # Define internet slang phrases
-    FILLER_PHRASES = [
-        "tbh",  # to be honest
-        "imo",  # in my opinion
-        "imho",  # in my humble opinion
-        "ngl",  # not gonna lie
-        "fr",  # for real
-        "frfr",  # for real for real
-        "lowkey",
-        "highkey",
-        "deadass",
-        "no cap",
-        "ong",  # on god
-        "istg",  # I swear to god
-    ]
-    
-    # Probability of inserting a filler phrase
-    FILLER_PROBABILITY = 0.40  # 40% chance per sentence (increased from 25%)
-    # Probability of inserting before adjectives/adverbs
-    BEFORE_WORD_PROB = 0.25  # 25% chance before certain words (increased from 15%)
-    
-    def add_filler_phrases(text):
-        # Split into sentences (simple approach using periods, exclamation, question marks)
-        
+        return self._detokenizer.detokenize([self.introduce_typo(word, rng) for word in words])
+
+    def add_filler_phrases(self, text, rng=random):
         # Split by sentence boundaries but keep the punctuation
-        sentences = re.split(r'([.!?]+)', text)
+        sentences = SENTENCE_SPLIT_PATTERN.split(text)
+        transformed_sentences = []
+
         # Recombine sentences with their punctuation
-        sentence_pairs = []
         for i in range(0, len(sentences) - 1, 2):
-            if i + 1 < len(sentences):
-                sentence_pairs.append((sentences[i], sentences[i + 1]))
-            else:
-                sentence_pairs.append((sentences[i], ""))
-        
-        transformed_sentences = []
-        
-        for sentence, punctuation in sentence_pairs:
+            sentence, punctuation = sentences[i], sentences[i + 1]
             if not sentence.strip():
                 transformed_sentences.append(sentence + punctuation)
                 continue
-            
+
             # Decide if we should add a filler phrase at the start of the sentence
-            if random.random() < FILLER_PROBABILITY:
-                filler = random.choice(FILLER_PHRASES)
+            if rng.random() < self.filler_probability:
+                filler = rng.choice(FILLER_PHRASES)
                 # Capitalize first letter if sentence starts with capital
-                if sentence and sentence[0].isupper():
+                if sentence[0].isupper():
                     filler = filler.capitalize()
                 sentence = filler + ", " + sentence
-            
-            # Also add filler words before certain words (adjectives, strong verbs)
-            # Common patterns: before "very", "really", "extremely", etc.
-            intensity_words = ["very", "really", "extremely", "incredibly", "absolutely", 
-                              "completely", "totally", "quite", "rather", "pretty"]
-            
-            words = sentence.split()
+
+            # Sometimes add filler before intensity words (using internet slang)
             new_words = []
-            for i, word in enumerate(words):
+            for word in sentence.split():
                 # Clean word for comparison (remove punctuation)
-                word_clean = re.sub(r'[^\w]', '', word.lower())
-                
-                # Sometimes add filler before intensity words (using internet slang)
-                if word_clean in intensity_words and random.random() < BEFORE_WORD_PROB:
-                    filler = random.choice(["lowkey", "highkey", "fr", "ngl", "tbh", "deadass"])
-                    new_words.append(filler)
-                
+                word_clean = NON_WORD_PATTERN.sub('', word.lower())
+                if word_clean in INTENSITY_WORDS and rng.random() < self.before_word_prob:
+                    new_words.append(rng.choice(INTENSITY_FILLERS))
                 new_words.append(word)
-            
-            sentence = " ".join(new_words)
-            transformed_sentences.append(sentence + punctuation)
-        
+
+            transformed_sentences.append(" ".join(new_words) + punctuation)
+
         return " ".join(transformed_sentences)
-    
-    # Apply filler phrases transformation
-    example["text"] = add_filler_phrases(example["text"])
+
+    # Same tokenization as word_tokenize, but keeps the sentence boundaries
+    def tokenize_sentences(self, text):
+        return [self._word_tokenizer.tokenize(sentence) for sentence in sent_tokenize(text)]
+
+    # Replace tokenized phrases with their acronym, longest phrase first
+    def _fused_acronyms(self, tokens):
+        lowered = [token.lower() for token in tokens]
+        result = []
+        i = 0
+        while i < len(tokens):
+            for n in self._acronym_lengths:
+                acronym = self._acronym_tokens.get(tuple(lowered[i:i + n]))
+                if acronym is not None:
+                    result.append(acronym)
+                    i += n
+                    break
+            else:
+                result.append(tokens[i])
+                i += 1
+        return result
+
+    # Filler at the start of the sentence and before intensity words
+    def _fused_fillers(self, tokens, rng):
+        result = []
+        if rng.random() < self.filler_probability:
+            filler = rng.choice(FILLER_PHRASES)
+            if tokens[0][0].isupper():
+                filler = filler.capitalize()
+            result.extend((filler, ","))
+        for token in tokens:
+            if token.lower() in INTENSITY_WORDS and rng.random() < self.before_word_prob:
+                result.append(rng.choice(INTENSITY_FILLERS))
+            result.append(token)
+        return result
+
+    # Single-pass pipeline: tokenize once, run every stage per sentence, detokenize once
+    def transform_text_fused(self, text, rng=random):
+        tokens = []
+        for sentence in self.tokenize_sentences(text):
+            # Punctuation-only "sentences" are kept as they are
+            if not any(token.isalnum() for token in sentence):
+                tokens.extend(sentence)
+                continue
+            sentence = self._fused_acronyms(sentence)
+            sentence = [self.replace_synonym(word, rng) for word in sentence]
+            sentence = [self.introduce_typo(word, rng) for word in sentence]
+            tokens.extend(self._fused_fillers(sentence, rng))
+        return self._detokenizer.detokenize(tokens)
+
+    def transform_text(self, text, rng=random):
+        if self.fused:
+            return self.transform_text_fused(text, rng)
+        text = self.replace_acronyms(text)
+        text = self.replace_synonyms(text, rng)
+        text = self.introduce_typos(text, rng)
+        return self.add_filler_phrases(text, rng)
+
+    # Per-example random generator derived from (seed, index); a str seed is hashed with sha512,
+    # so it is stable across processes and Python runs
+    def example_rng(self, idx):
+        if idx is None:
+            return random
+        return random.Random(f"{self.seed}:{idx}")
+
+    def __call__(self, example, idx=None):
+        example["text"] = self.transform_text(example["text"], self.example_rng(idx))
+        return example
+
+    # Batched entry point for datasets.map(..., batched=True)
+    def batch(self, examples, indices=None):
+        if indices is None:
+            examples["text"] = [self.transform_text(text) for text in examples["text"]]
+        else:
+            examples["text"] = [self.transform_text(text, self.example_rng(idx))
+                                for text, idx in zip(examples["text"], indices)]
+        return examples
+
+
+default_transform = CustomTransform()
+
+
+def custom_transform(example):
+    ################################
+    ##### YOUR CODE BEGINGS HERE ###
+
+    # Design and implement the transformation as mentioned in pdf
+    # You are free to implement any transformation but the comments at the top roughly describe
+    # how you could implement two of them --- synonym replacement and typos.
+
+    # You should update example["text"] using your transformation
+    # The phrase -> acronym, synonym, typo and filler stages live in CustomTransform above
+
+    example = default_transform(example)
 
     ##### YOUR CODE ENDS HERE ######
 